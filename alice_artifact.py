@@ -0,0 +1,229 @@
+"""
+Precompiled diagnosis artifacts.
+
+compile_artifact composes the system once and writes everything a diagnosis needs to one file: the system
+contract, the diagnostics graph and its term index, the component-level inputs reaching every system-level
+guarantee (as bitsets over the compacted graph) and the Python source of every term. The file holds plain
+Python data only, so loading it and diagnosing a trace needs the standard library alone; pacti, sympy and
+networkx are imported to compile an artifact or to rebuild the graph, and sympy to check a term with more than
+MAX_ENUMERATED unassigned variables (see alice_tracevalues.py) as CompiledTerm does.
+"""
+import itertools
+import os
+import pickle
+import tempfile
+import zlib
+from collections import namedtuple
+from alice_tracevalues import MAX_ENUMERATED
+
+ARTIFACT_VERSION = 1
+_MAGIC = b'ALICE-AR' + bytes([ARTIFACT_VERSION])
+
+# assumptions: violated assumption terms, violated: (index in the system guarantees, term, node) of the violated
+# guarantees, to_check: (node, term, contract) of the component-level inputs reaching them, components:
+# (node, term, contract, status) of the checked component guarantees, status 'violated', 'satisfied' or
+# 'unknown' (holds for some but not all values of the unassigned variables)
+Diagnosis = namedtuple('Diagnosis', ['assumptions', 'violated', 'to_check', 'components'])
+
+
+class _Term:
+    # evaluation of the compiled source of a term, on partial assignments by enumerating the unassigned variables
+    max_enumerated = MAX_ENUMERATED
+
+    def __init__(self, key, support, source):
+        self.key = key
+        self.support = support
+        self._fn = eval(f'lambda {", ".join(f"v{k}" for k in range(len(support)))}: {source}') if source else None
+
+    def status(self, values):
+        if self._fn is None:
+            return self._status_slow(values)
+        missing = [k for k, name in enumerate(self.support) if name not in values]
+        args = [values.get(name, 0) for name in self.support]
+        if not missing:
+            return 'satisfied' if self._fn(*args) else 'violated'
+        if len(missing) > self.max_enumerated:
+            return self._status_slow(values)
+        results = set()
+        for assignment in itertools.product((0, 1), repeat=len(missing)):
+            for k, value in zip(missing, assignment):
+                args[k] = value
+            results.add(self._fn(*args))
+            if len(results) == 2:
+                return 'unknown'
+        return 'satisfied' if True in results else 'violated'
+
+    def _status_slow(self, values):
+        # terms with operators that cannot be compiled, or with too many unassigned variables, go through sympy
+        from alice_helperfunctions import CompiledTerm, term_evaluators
+        compiled = term_evaluators.get(self.key)
+        if compiled(values):
+            return 'satisfied'
+        if all(name in values for name in self.support):
+            return 'violated'
+        return 'violated' if CompiledTerm(~compiled.expression)(values) else 'unknown'
+
+
+class Artifact:
+    """
+    A loaded diagnosis artifact, see compile_artifact for its content.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.horizon = data['horizon']
+        self.width = data['width']
+        self.contract = data['contract']
+        self.sources = data['sources']
+        self._terms = {}
+        self._graph = None
+
+    def term(self, key):
+        term = self._terms.get(key)
+        if term is None:
+            support, source = self.data['terms'][key]
+            term = self._terms[key] = _Term(key, support, source)
+        return term
+
+    def relevant_sources(self, sinks):
+        """
+        Component-level inputs reaching any of sinks, ordered by first sink reached and then source order.
+        """
+        reach = self.data['reach']
+        seen = 0
+        sources = []
+        for sink in sinks:
+            bits = reach.get(sink, 0) & ~seen
+            seen |= bits
+            while bits:
+                low = bits & -bits
+                sources.append(self.sources[low.bit_length() - 1])
+                bits ^= low
+        return sources
+
+    def diagnose(self, values, internal=None):
+        """
+        Diagnose one behavior.
+        Inputs:
+        values: Observed values {name: value}
+        internal: Optional internal values {name: value} for the component checks
+        Returns:
+        Diagnosis
+        """
+        assumptions = [key for key in self.contract['assumptions'] if self.term(key).status(values) != 'satisfied']
+        violated = []
+        for i, (key, node) in enumerate(zip(self.contract['guarantees'], self.data['guarantee_nodes'])):
+            if self.term(key).status(values) != 'satisfied':
+                violated.append((i, key, node))
+        to_check = self.relevant_sources([node for _, _, node in violated if node is not None])
+
+        behavior = values | internal if internal else values
+        statuses = {}
+        components = []
+        for node, key, contract in to_check:
+            if key not in statuses:
+                statuses[key] = self.term(key).status(behavior)
+            components.append((node, key, contract, statuses[key]))
+        return Diagnosis(assumptions, violated, to_check, components)
+
+    def graph(self):
+        """
+        The diagnostics graph as a networkx DiGraph with its term index.
+        """
+        if self._graph is None:
+            import networkx as nx
+            from alice_helperfunctions import TermIndex
+            G = nx.DiGraph()
+            G.add_nodes_from(self.data['nodes'])
+            G.add_edges_from(self.data['edges'])
+            index = G.graph['term_index'] = TermIndex()
+            for key, nodes in self.data['term_nodes'].items():
+                index.nodes[key] = list(nodes)
+            self._graph = G
+        return self._graph
+
+
+def compile_artifact(path, horizon=2, width=100, cache=None, processes=None):
+    """
+    Compose the Alice system over horizon timesteps and write its diagnosis artifact to path.
+    Inputs:
+    path: Artifact file
+    horizon, width: Number of timesteps and of extra x/y/z variables of the components
+    cache: Optional CompositionCache
+    processes: Optional number of processes for unroll
+    Returns:
+    Artifact
+    """
+    from alice_unrolling import unroll
+    full_sys, G, _ = unroll(horizon, cache=cache, processes=processes, width=width)
+    data = artifact_data(full_sys, G, horizon, width)
+    write_artifact(path, data)
+    return Artifact(data)
+
+
+def artifact_data(full_sys, G, horizon, width):
+    """
+    Content of the artifact of a composed system, see compile_artifact.
+    Inputs:
+    full_sys, G: System contract and diagnostics graph over horizon timesteps (as returned by unroll)
+    horizon, width: Number of timesteps and of extra x/y/z variables of the components
+    """
+    from alice_helperfunctions import ReachabilityIndex, system_guarantee_nodes, term_evaluators, term_index
+    from alice_compaction import compact_graph
+    from alice_cache import canonical_contract
+
+    index = term_index(G)
+
+    # output guarantees of the last composition
+    guarantees = system_guarantee_nodes(G)
+    sinks = [node for nodes in guarantees.values() for node in nodes]
+    component_contracts = {f'{component}_{k}' for k in range(1, horizon+1) for component in ['perception', 'planner', 'tracker']}
+    sources = [node for node, attrs in G.nodes(data=True) if attrs['input'] == 'True' and attrs['contract'] in component_contracts]
+
+    contract = canonical_contract(full_sys)
+    guarantee_nodes = [guarantees[key][0] if key in guarantees else None for key in contract['guarantees']]
+    compact_G, _ = compact_graph(G, sinks, sources)
+    reachability = ReachabilityIndex(compact_G, sources)
+
+    terms = {}
+    for key in contract['assumptions'] + contract['guarantees'] + [G.nodes[node]['term'] for node in sources]:
+        if key not in terms:
+            compiled = term_evaluators.get(index.term(key) if key in index else key)
+            terms[key] = (compiled.support, compiled.source)
+
+    data = {
+        'horizon': horizon,
+        'width': width,
+        'contract': contract,
+        'terms': terms,
+        'guarantee_nodes': guarantee_nodes,
+        'sources': [(node, G.nodes[node]['term'], G.nodes[node]['contract']) for node in reachability.sources],
+        'reach': {node: reachability.bits(node) for node in sinks if reachability.bits(node)},
+        'nodes': [(node, dict(attrs)) for node, attrs in G.nodes(data=True)],
+        'edges': list(G.edges()),
+        'term_nodes': {key: list(nodes) for key, nodes in index.nodes.items()},
+    }
+    return data
+
+
+def write_artifact(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_MAGIC + zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_artifact(path):
+    """
+    Load an artifact written by compile_artifact.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        raise ValueError(f'{path} is not a diagnosis artifact of version {ARTIFACT_VERSION}')
+    return Artifact(pickle.loads(zlib.decompress(data[len(_MAGIC):])))
@@ -0,0 +1,98 @@
+"""
+Batch diagnosis of many samples at once with NumPy.
+
+A columnar trace maps every variable to the list of its values over K samples, like the traces of
+system_trace.py (trace['v_t1'] = [0]) with K > 1. All system guarantees are evaluated over all samples as
+boolean arrays, and samples are grouped by the set of guarantees they violate, so the root-cause search and
+the second-stage component checks run once per distinct violation signature instead of once per sample.
+"""
+from collections import namedtuple
+import numpy as np
+from alice_helperfunctions import term_evaluators, ReachabilityIndex, system_guarantee_nodes
+
+# Diagnosis of the samples sharing one violation signature:
+# violated: indices of the violated system guarantees, samples: indices of the samples with this signature,
+# violated_nodes: diagnostics graph nodes of the violated guarantees, to_check: component-level input nodes
+# feeding them, component_violations: len(samples) x len(to_check) matrix, True where a component term is violated
+SignatureDiagnosis = namedtuple('SignatureDiagnosis', ['violated', 'samples', 'violated_nodes', 'to_check', 'component_violations'])
+
+
+def trace_columns(trace):
+    """
+    Convert a columnar trace {name: [v_0, ..., v_K-1]} into boolean arrays.
+    Returns:
+    columns: {name: boolean array of length K}
+    K: Number of samples
+    """
+    columns = {key: np.asarray(values, dtype=bool) for key, values in trace.items()}
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f'Trace columns have different lengths: {sorted(lengths)}')
+    return columns, lengths.pop() if lengths else 0
+
+
+def violation_matrix(terms, columns, n):
+    """
+    Evaluate terms (PropositionalTerms or term strings) on n samples.
+    Returns:
+    n x len(terms) boolean matrix, True where the sample violates the term.
+    """
+    matrix = np.empty((n, len(terms)), dtype=bool)
+    for j, term in enumerate(terms):
+        matrix[:, j] = ~term_evaluators.get(term).batch(columns, n)
+    return matrix
+
+
+def group_by_signature(matrix):
+    """
+    Group the rows of a violation matrix by their violation signature.
+    Returns:
+    List of (violated column indices, row indices) for every distinct signature.
+    """
+    if matrix.shape[0] == 0:
+        return []
+    signatures, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return [(tuple(int(j) for j in np.flatnonzero(signature)), np.flatnonzero(inverse == k)) for k, signature in enumerate(signatures)]
+
+
+def diagnose_batch(full_sys, G, trace, component_level_input_nodes, internal_trace=None, reachability=None):
+    """
+    Diagnose all samples of a columnar trace.
+    Inputs:
+    full_sys: System contract
+    G: Diagnostics graph of full_sys
+    trace: Columnar system trace {name: [v_0, ..., v_K-1]}
+    component_level_input_nodes: Candidate root-cause nodes in G
+    internal_trace: Optional columnar trace of internal variables for the second-stage checks
+    reachability: ReachabilityIndex of G over component_level_input_nodes (built if not given)
+    Returns:
+    matrix: K x len(full_sys.g.terms) violation matrix
+    diagnoses: SignatureDiagnosis for every distinct signature with at least one violated guarantee
+    """
+    columns, n = trace_columns(trace)
+    matrix = violation_matrix(full_sys.g.terms, columns, n)
+    if reachability is None:
+        reachability = ReachabilityIndex(G, component_level_input_nodes)
+
+    # output guarantee node of every guarantee term in the last composition
+    guarantee_nodes = {term: nodes[0] for term, nodes in system_guarantee_nodes(G).items()}
+
+    if internal_trace is not None:
+        internal_columns, _ = trace_columns(internal_trace)
+        columns = columns | internal_columns
+
+    diagnoses = []
+    for violated, samples in group_by_signature(matrix):
+        if not violated:
+            continue
+        # None for a guarantee without a node in G
+        violated_nodes = [guarantee_nodes.get(term_evaluators.key(full_sys.g.terms[j])) for j in violated]
+        to_check = reachability.relevant_sources([node for node in violated_nodes if node is not None])
+        check_terms = [G.nodes[node]['term'] for node in to_check]
+        # only the variables of the checked terms, restricted to the samples of the group
+        support = {name for term in check_terms for name in term_evaluators.get(term).support}
+        group_columns = {name: columns[name][samples] for name in support if name in columns}
+        component_violations = violation_matrix(check_terms, group_columns, len(samples))
+        diagnoses.append(SignatureDiagnosis(violated, samples, violated_nodes, to_check, component_violations))
+    return matrix, diagnoses
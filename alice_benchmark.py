@@ -0,0 +1,257 @@
+"""
+Benchmarks for the Alice diagnostics pipeline.
+Run with: python alice_benchmark.py [check | scaling --help]
+
+The scaling suite sweeps the width of the components (number of extra x/y/z variables) and the horizon
+(number of timesteps), and records wall time and peak memory of every stage of the pipeline. Results are
+written as JSON, and a previous result file can be given as a baseline to report regressions.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pacti.iocontract import Var
+from alice_unrolling import unroll
+from alice_instrumentation import Hook, hooks, span
+from alice_second_stage import SecondStage, fetch_from
+from alice_contracts import get_perception_contract, get_planner_contract, get_tracker_contract
+from alice_helperfunctions import TermEvaluatorCache, behavior_values, check_guarantee_subst, evaluate_term, term_evaluators, ReachabilityIndex
+from system_trace import get_system_trace, get_internal_system_trace
+
+STAGES = ['composition', 'graph_building', 'connect_graphs', 'reachability', 'trace_evaluation']
+# benchmark stage of the spans of the pipeline (see alice_instrumentation.py), the instantiation of a template
+# (renaming the contract and the graph of a timestep) counts as graph building
+_SPAN_STAGES = {
+    'compose_diagnostics': 'composition',
+    'build_composition_graph': 'graph_building',
+    'instantiate': 'graph_building',
+    'connect_graphs': 'connect_graphs',
+    'reachability_index': 'reachability',
+    'has_path': 'reachability',
+    'system_checks': 'trace_evaluation',
+    'second_stage': 'trace_evaluation',
+}
+
+
+def _timeit(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_check_guarantee(timesteps=(1, 2), repeat=5):
+    """
+    Compare the substitution-based check_guarantee against compiled evaluators
+    on every component guarantee for the given timesteps.
+    """
+    terms = []
+    for t in timesteps:
+        for contract in [get_perception_contract(t), get_planner_contract(t), get_tracker_contract(t)]:
+            terms += contract.g.terms
+    trace = get_system_trace() | get_internal_system_trace()
+    behavior = {Var(key): trace[key][0] for key in trace.keys()}
+
+    subst_time, expected = _timeit(lambda: [check_guarantee_subst(term, behavior) for term in terms], repeat)
+
+    def compiled(cache):
+        values = behavior_values(behavior)
+        return [cache.get(term)(values) for term in terms]
+
+    cold_time = 0.0
+    for _ in range(repeat):
+        cache = TermEvaluatorCache()
+        start = time.perf_counter()
+        result = compiled(cache)
+        cold_time += (time.perf_counter() - start) / repeat
+        assert result == expected
+    warm_time, result = _timeit(lambda: compiled(cache), repeat)
+    assert result == expected
+
+    print(f'check_guarantee over {len(terms)} terms, {len(behavior)} behavior variables')
+    print(f'  substitution:        {subst_time*1e3:10.2f} ms')
+    print(f'  compiled (cold):     {cold_time*1e3:10.2f} ms  ({subst_time/cold_time:.1f}x)')
+    print(f'  compiled (warm):     {warm_time*1e3:10.2f} ms  ({subst_time/warm_time:.1f}x)')
+    return {'terms': len(terms), 'substitution': subst_time, 'compiled_cold': cold_time, 'compiled_warm': warm_time}
+
+
+class StageRecorder(Hook):
+    """
+    Hook accumulating the wall time, number of spans and peak memory (with trace_memory) of every stage.
+    Peak memory is the largest increase of traced memory during one span of the stage.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {stage: {'time': 0.0, 'calls': 0, 'peak_bytes': 0} for stage in STAGES}
+        self._active = None
+
+    def start(self, span):
+        # spans nested in a recorded span are part of it
+        if span.stage not in _SPAN_STAGES or self._active is not None:
+            return
+        self._active = span
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._before = tracemalloc.get_traced_memory()[0]
+
+    def end(self, span):
+        if span is not self._active:
+            return
+        self._active = None
+        record = self.stages[_SPAN_STAGES[span.stage]]
+        record['time'] += span.duration
+        record['calls'] += 1
+        if self.trace_memory:
+            record['peak_bytes'] = max(record['peak_bytes'], tracemalloc.get_traced_memory()[1] - self._before)
+
+
+def run_pipeline(width, horizon, trace_memory=False):
+    """
+    Run the diagnosis of the Alice example for one width and horizon, without the composition cache and with
+    cold term evaluators.
+    Returns:
+    Dictionary of the stage records, the total time and the sizes of the problem.
+    """
+    recorder = StageRecorder(trace_memory)
+    term_evaluators.clear()
+    start = time.perf_counter()
+
+    with hooks(recorder):
+        full_sys, G, _ = unroll(horizon, width=width)
+
+        component_contracts = {f'{component}_{k}' for k in range(1, horizon+1) for component in ['perception', 'planner', 'tracker']}
+        component_level_input_nodes = [node for node, attrs in G.nodes(data=True) if attrs['input'] == 'True' and attrs['contract'] in component_contracts]
+        # output guarantee nodes of the last composition (a single timestep has no system-level composition)
+        top = 'full_system' if horizon > 1 else f'system_{horizon}'
+        guarantee_nodes = {}
+        for node, attrs in G.nodes(data=True):
+            if attrs['contract'] == top and attrs['type'] == 'guarantee' and attrs['output'] == 'True':
+                guarantee_nodes.setdefault(attrs['term'], node)
+        trace = get_system_trace(width, horizon)
+        internal_trace = get_internal_system_trace(horizon)
+
+        with span('system_checks'):
+            values = {key: trace[key][0] for key in trace}
+            violated = [term_evaluators.key(term) for term in full_sys.g.terms if not evaluate_term(term, values)]
+            violated_nodes = [guarantee_nodes[term] for term in violated if term in guarantee_nodes]
+
+        with span('has_path'):
+            reachability = ReachabilityIndex(G, component_level_input_nodes)
+            to_check = reachability.relevant_sources(violated_nodes)
+
+        results = SecondStage(G, values, fetch=fetch_from(internal_trace)).run(to_check)
+        violated_components = [node for result in results if result.status == 'violated' for node in result.nodes]
+
+    return {
+        'width': width,
+        'horizon': horizon,
+        'total_time': time.perf_counter() - start,
+        'stages': recorder.stages,
+        'nodes': G.number_of_nodes(),
+        'edges': G.number_of_edges(),
+        'guarantees': len(full_sys.g.terms),
+        'violated': len(violated),
+        'to_check': len(to_check),
+        'violated_components': len(violated_components),
+    }
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def bench_scaling(widths=(10, 100, 1000), horizons=(1, 2, 5, 10), repeat=3, memory=True, budget=None, output=None):
+    """
+    Sweep widths and horizons, every run is repeated and the fastest one is kept.
+    Peak memory is measured in an extra run with tracemalloc, which would distort the timings.
+    Horizons after the first one taking longer than budget seconds are skipped for that width.
+    Returns:
+    Dictionary with the metadata of the run and one result per (width, horizon).
+    """
+    results = []
+    for width in widths:
+        for horizon in sorted(horizons):
+            best = min((run_pipeline(width, horizon) for _ in range(repeat)), key=lambda r: r['total_time'])
+            if memory:
+                tracemalloc.start()
+                try:
+                    traced = run_pipeline(width, horizon, trace_memory=True)
+                finally:
+                    tracemalloc.stop()
+                for stage, record in best['stages'].items():
+                    record['peak_bytes'] = traced['stages'][stage]['peak_bytes']
+            results.append(best)
+            print(f'width {width:6d} horizon {horizon:4d}  {best["total_time"]:9.3f} s  ' +
+                  '  '.join(f'{stage} {record["time"]:.3f} s' for stage, record in best['stages'].items()), flush=True)
+            if budget is not None and best['total_time'] > budget:
+                break
+    report = {'metadata': _metadata(), 'results': results}
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def compare_results(baseline, current, tolerance=0.2, min_time=1e-3):
+    """
+    Compare two reports of bench_scaling.
+    Returns:
+    List of (width, horizon, stage, metric, baseline value, current value) where current is more than
+    tolerance (relative) above the baseline. Times below min_time seconds are ignored.
+    """
+    previous = {(r['width'], r['horizon']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get((result['width'], result['horizon']))
+        if old is None:
+            continue
+        for stage, record in result['stages'].items():
+            old_record = old['stages'].get(stage)
+            if old_record is None:
+                continue
+            for metric, floor in [('time', min_time), ('peak_bytes', 0)]:
+                before, after = old_record[metric], record[metric]
+                if after > floor and after > before * (1 + tolerance):
+                    regressions.append((result['width'], result['horizon'], stage, metric, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for the Alice diagnostics pipeline.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('check', help='compiled term evaluators against substitution')
+    scaling = subparsers.add_parser('scaling', help='stage timings over widths and horizons')
+    scaling.add_argument('--widths', type=int, nargs='+', default=[10, 100, 1000])
+    scaling.add_argument('--horizons', type=int, nargs='+', default=[1, 2, 5, 10])
+    scaling.add_argument('--repeat', type=int, default=3)
+    scaling.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc run')
+    scaling.add_argument('--budget', type=float, help='seconds per run above which larger horizons are skipped')
+    scaling.add_argument('--output', default='benchmark_results.json')
+    scaling.add_argument('--baseline', help='results of a previous run to compare with')
+    scaling.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'scaling':
+        report = bench_scaling(args.widths, args.horizons, args.repeat, args.memory, args.budget, args.output)
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_results(json.load(f), report, args.tolerance)
+            for width, horizon, stage, metric, before, after in regressions:
+                print(f'REGRESSION width {width} horizon {horizon} {stage} {metric}: {before:.4g} -> {after:.4g}')
+            return 1 if regressions else 0
+    else:
+        bench_check_guarantee()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Persistent on-disk cache of compose_diagnostics results.
+
+Entries are addressed by a hash of the canonical form of the composed contracts, vars_to_keep and a hash of
+the Pacti sources, and hold the composed contract and its diagnostics graph as compressed pickles. Writes go through a
+temporary file and an atomic rename, so several processes can share one cache directory; eviction of the
+least recently used entries beyond max_bytes is serialized with a lock file.
+MemoryCache keeps results in memory by the same key, optionally in front of a CompositionCache.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import zlib
+from pacti.terms.propositions.propositions import _expr_to_str
+from alice_instrumentation import span, graph_size
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows): eviction is best effort
+    fcntl = None
+
+CACHE_VERSION = 1
+_MAGIC = b'ALICE-CC' + bytes([CACHE_VERSION])
+_SUFFIX = '.bin'
+
+
+def _pacti_source():
+    # part of every key, so entries composed by another Pacti are not served; Pacti is installed from a pinned
+    # commit, whose package version does not change with the source
+    import pacti
+    digest = hashlib.sha256()
+    for root in sorted(pacti.__path__):
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    path = os.path.join(directory, name)
+                    digest.update(os.path.relpath(path, root).encode() + b'\0')
+                    with open(path, 'rb') as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+PACTI_SOURCE = _pacti_source()
+
+
+def canonical_contract(contract):
+    """
+    Canonical description of a contract: variable names and term strings, in order.
+    """
+    return {
+        'input_vars': [v.name for v in contract.inputvars],
+        'output_vars': [v.name for v in contract.outputvars],
+        'assumptions': [_expr_to_str(term.expression) for term in contract.a.terms],
+        'guarantees': [_expr_to_str(term.expression) for term in contract.g.terms],
+    }
+
+
+def composition_key(contract, other, vars_to_keep=None):
+    """
+    Content hash of the composition of contract with other, keeping vars_to_keep.
+    """
+    description = {
+        'version': CACHE_VERSION,
+        'pacti': PACTI_SOURCE,
+        'self': canonical_contract(contract),
+        'other': canonical_contract(other),
+        'vars_to_keep': sorted(vars_to_keep) if vars_to_keep else [],
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+class CompositionCache:
+    """
+    Content-addressed cache of (contract, diagnostics graph) pairs in a directory.
+    Inputs:
+    directory: Cache directory (ALICE_CACHE_DIR or .alice_cache by default)
+    max_bytes: Total size of the entries above which the least recently used ones are evicted
+    """
+    def __init__(self, directory=None, max_bytes=1 << 30):
+        self.directory = directory or os.environ.get('ALICE_CACHE_DIR', '.alice_cache')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """
+        Return the cached (contract, G) for key, or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(_MAGIC):
+                raise ValueError(f'{path} is not a cache entry of version {CACHE_VERSION}')
+            value = pickle.loads(zlib.decompress(data[len(_MAGIC):]))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, zlib.error, pickle.UnpicklingError, EOFError, ImportError, AttributeError):
+            # unreadable or stale entry (e.g. pickled with classes that no longer exist): drop it and recompute
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store value under key.
+        """
+        data = _MAGIC + zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self.evict()
+
+    def compose_diagnostics(self, contract, other, vars_to_keep=None):
+        """
+        Cached contract.compose_diagnostics(other, vars_to_keep=vars_to_keep).
+        """
+        key = composition_key(contract, other, vars_to_keep)
+        value = self.get(key)
+        if value is None:
+            value = _compose(contract, other, vars_to_keep)
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is at most max_bytes.
+        """
+        with self._lock():
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(_SUFFIX):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(os.path.join(self.directory, name))
+                total -= size
+
+    def clear(self):
+        with self._lock():
+            for name in os.listdir(self.directory):
+                if name.endswith(_SUFFIX):
+                    self._remove(os.path.join(self.directory, name))
+
+    def _lock(self):
+        return _FileLock(os.path.join(self.directory, '.lock'))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class MemoryCache:
+    """
+    In-memory cache of compose_diagnostics results by composition_key, in front of an optional
+    CompositionCache. collect() drops the entries not used since the last collect().
+    """
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+
+    def compose_diagnostics(self, contract, other, vars_to_keep=None):
+        key = composition_key(contract, other, vars_to_keep)
+        self._used.add(key)
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        if self.backing is not None:
+            value = self.backing.compose_diagnostics(contract, other, vars_to_keep)
+        else:
+            value = _compose(contract, other, vars_to_keep)
+        self.entries[key] = value
+        return value
+
+    def collect(self):
+        self.entries = {key: value for key, value in self.entries.items() if key in self._used}
+        self._used = set()
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+def _compose(contract, other, vars_to_keep):
+    if vars_to_keep:
+        return contract.compose_diagnostics(other, vars_to_keep=vars_to_keep)
+    return contract.compose_diagnostics(other)
+
+
+def compose_diagnostics(contract, other, vars_to_keep=None, cache=None):
+    """
+    contract.compose_diagnostics(other, vars_to_keep=vars_to_keep), through cache if one is given.
+    """
+    terms = len(contract.a.terms) + len(contract.g.terms) + len(other.a.terms) + len(other.g.terms)
+    with span('compose_diagnostics', input_terms=terms) as sp:
+        sp.track('cache', cache)
+        if cache is not None:
+            result = cache.compose_diagnostics(contract, other, vars_to_keep)
+        else:
+            result = _compose(contract, other, vars_to_keep)
+        composed, G = result
+        sp.set(terms=len(composed.a.terms) + len(composed.g.terms), **graph_size(G))
+    return result
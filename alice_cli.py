@@ -0,0 +1,166 @@
+"""
+Command line entry point for the Alice diagnosis.
+
+    python alice_cli.py compile [--horizon 2] [--width 100] [--output alice.artifact]
+    python alice_cli.py diagnose alice.artifact trace.json [--internal internal.json] [--sample 0] [--json]
+    python alice_cli.py serve alice.artifact [--socket alice.sock | --port 8765] [--processes N] [--queue-size 64]
+    python alice_cli.py load trace.json [--socket alice.sock | --port 8765] [--requests 1000] [--connections 8]
+
+compile composes the system and writes a diagnosis artifact (see alice_artifact.py). diagnose checks a trace
+with a compiled artifact without composing anything, and only imports the standard library for it. Traces are
+JSON objects {name: value} or columnar {name: [v_0, ...]}, JSON lines or CSV files (one record per line or row,
+merged into one behavior), or trace stores (.trc, see alice_tracestore.py). diagnose exits with status 1 if a
+system guarantee is violated. serve runs the diagnosis service of alice_service.py and load submits a trace
+to it repeatedly and reports throughput and latency.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+
+def read_values(path, sample=0):
+    """
+    Read one behavior {name: value} from a trace file, sample selects the sample of columnar traces.
+    """
+    from alice_tracevalues import parse_value
+    if path.endswith('.trc'):
+        from alice_tracestore import TraceStore
+        with TraceStore(path) as store:
+            return store.sample(sample)
+    values = {}
+    with (sys.stdin if path == '-' else open(path, newline='')) as f:
+        if path.endswith('.csv'):
+            records = csv.DictReader(f)
+        elif path.endswith('.jsonl'):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = [json.load(f)]
+        for record in records:
+            for name, value in record.items():
+                if name == 'timestep' or value in (None, ''):
+                    continue
+                if isinstance(value, list):
+                    value = value[sample]
+                values[name] = parse_value(value, name)
+    return values
+
+
+def _compile(args):
+    cache = None
+    if not args.no_cache:
+        from alice_cache import CompositionCache
+        cache = CompositionCache()
+    from alice_artifact import compile_artifact
+    start = time.perf_counter()
+    artifact = compile_artifact(args.output, args.horizon, args.width, cache, args.processes)
+    print(f'Wrote {args.output}: horizon {artifact.horizon}, width {artifact.width}, {len(artifact.data["nodes"])} nodes, '
+          f'{len(artifact.contract["guarantees"])} system guarantees, {len(artifact.sources)} component-level inputs '
+          f'in {time.perf_counter() - start:.2f} s')
+    return 0
+
+
+def _diagnose(args):
+    from alice_artifact import load_artifact
+    artifact = load_artifact(args.artifact)
+    values = read_values(args.trace, args.sample)
+    internal = read_values(args.internal, args.sample) if args.internal else None
+    diagnosis = artifact.diagnose(values, internal)
+
+    if args.json:
+        json.dump(diagnosis._asdict(), sys.stdout)
+        print()
+    else:
+        for key in diagnosis.assumptions:
+            print(f'Assumption {key} is NOT satisfied')
+        for i, key, node in diagnosis.violated:
+            print(f'Guarantee no. {i+1}/{len(artifact.contract["guarantees"])}: {key} is violated by node {node}')
+        print(f'Have to check {len(diagnosis.to_check)} out of {len(artifact.sources)} component level inputs')
+        for node, key, contract, status in diagnosis.components:
+            mark = {'violated': '***', 'satisfied': '---'}.get(status, '???')
+            print(f'{mark} {status.capitalize()} Guarantee {key} from {contract}')
+    return 1 if diagnosis.violated else 0
+
+
+def _serve(args):
+    import asyncio
+    from alice_service import DiagnosisService
+
+    def report(metrics):
+        print(f'{metrics["completed"]} done, {metrics["failed"]} failed, queue {metrics["queue_depth"]}/{metrics["queue_size"]} '
+              f'(max {metrics["max_queue_depth"]}), {metrics["recent_throughput"] or 0:.1f}/s', file=sys.stderr, flush=True)
+
+    async def serve():
+        service = DiagnosisService(args.artifact, args.processes, args.queue_size)
+        async with service:
+            await service.start(args.socket, args.host, args.port, args.metrics_interval, report)
+            print(f'Serving {args.artifact} on {args.socket or f"{args.host}:{args.port}"} with {service.processes} processes', file=sys.stderr, flush=True)
+            await service.serve_forever()
+
+    if args.socket is None and args.port is None:
+        args.socket = 'alice.sock'
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _load(args):
+    import asyncio
+    from alice_service import generate_load
+    values = read_values(args.trace, args.sample)
+    internal = read_values(args.internal, args.sample) if args.internal else None
+    if args.socket is None and args.port is None:
+        args.socket = 'alice.sock'
+    stats = asyncio.run(generate_load(values, args.socket, args.host, args.port, args.requests, args.connections,
+                                      args.window, internal, args.flip, args.seed))
+    json.dump(stats, sys.stdout, indent=2)
+    print()
+    return 1 if stats['errors'] else 0
+
+
+def _add_address(parser):
+    parser.add_argument('--socket', help='Unix socket (alice.sock if no --port is given)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='TCP port')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compositional diagnosis of the Alice example.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help='compose the system and write a diagnosis artifact')
+    compile_parser.add_argument('--horizon', type=int, default=2)
+    compile_parser.add_argument('--width', type=int, default=100)
+    compile_parser.add_argument('--output', default='alice.artifact')
+    compile_parser.add_argument('--processes', type=int, help='compose in a pool of processes')
+    compile_parser.add_argument('--no-cache', action='store_true', help='do not use the on-disk composition cache')
+    diagnose_parser = subparsers.add_parser('diagnose', help='diagnose a trace with a compiled artifact')
+    diagnose_parser.add_argument('artifact')
+    diagnose_parser.add_argument('trace', help='trace file, - for JSON on stdin')
+    diagnose_parser.add_argument('--internal', help='trace file of internal variables for the component checks')
+    diagnose_parser.add_argument('--sample', type=int, default=0, help='sample of columnar traces')
+    diagnose_parser.add_argument('--json', action='store_true', help='print the diagnosis as JSON')
+    serve_parser = subparsers.add_parser('serve', help='run the diagnosis service')
+    serve_parser.add_argument('artifact')
+    _add_address(serve_parser)
+    serve_parser.add_argument('--processes', type=int, help='worker processes, one per CPU by default')
+    serve_parser.add_argument('--queue-size', type=int, default=64, help='maximum number of queued traces')
+    serve_parser.add_argument('--metrics-interval', type=float, default=10, help='seconds between metrics reports')
+    load_parser = subparsers.add_parser('load', help='submit a trace to the diagnosis service repeatedly')
+    load_parser.add_argument('trace')
+    _add_address(load_parser)
+    load_parser.add_argument('--internal', help='trace file of internal variables for the component checks')
+    load_parser.add_argument('--sample', type=int, default=0, help='sample of columnar traces')
+    load_parser.add_argument('--requests', type=int, default=1000)
+    load_parser.add_argument('--connections', type=int, default=8)
+    load_parser.add_argument('--window', type=int, default=4, help='unanswered submissions per connection')
+    load_parser.add_argument('--flip', type=float, default=0.0, help='probability of negating each observed value')
+    load_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    return {'compile': _compile, 'diagnose': _diagnose, 'serve': _serve, 'load': _load}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
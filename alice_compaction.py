@@ -0,0 +1,102 @@
+"""
+Compaction of diagnostics graphs before diagnosis.
+
+Most of a diagnostics graph is pass-through chains and terms that never reach a system-level guarantee. The
+root-cause search only asks which component-level inputs (sources) reach the violated system-level
+guarantees (sinks), so compact_graph drops every node that is not on a path from a source to a sink and
+contracts linear chains of the remaining nodes into one node. Sources and sinks keep their names, so the
+sources found on the compacted graph are the nodes to check in the original graph.
+"""
+import networkx as nx
+from alice_instrumentation import span, graph_size
+
+
+def prune_graph(G, sinks, sources):
+    """
+    Subgraph of G on the nodes reachable from sources that reach sinks.
+    """
+    upstream = _reachable(G.predecessors, [node for node in sinks if node in G])
+    downstream = _reachable(lambda node: (succ for succ in G.successors(node) if succ in upstream), [node for node in sources if node in upstream])
+    return G.subgraph(downstream)
+
+
+def _reachable(neighbors, start):
+    seen = set(start)
+    stack = list(seen)
+    while stack:
+        for node in neighbors(stack.pop()):
+            if node not in seen:
+                seen.add(node)
+                stack.append(node)
+    return seen
+
+
+def contract_chains(G, keep=()):
+    """
+    Contract every maximal chain of nodes with one predecessor and one successor (other than the nodes in keep)
+    into its first node.
+    Returns:
+    H: Contracted graph, the first node of a chain keeps its attributes
+    members: {node of H: [nodes of G it stands for, in chain order]}
+    """
+    keep = set(keep)
+
+    def linear(node):
+        return node not in keep and G.in_degree(node) == 1 and G.out_degree(node) == 1
+
+    H = nx.DiGraph()
+    members = {}
+    for node, attrs in G.nodes(data=True):
+        if not linear(node):
+            H.add_node(node, **attrs)
+            members[node] = [node]
+    # chains start at a linear node whose predecessor is not linear
+    for node in G.nodes():
+        if not linear(node) or linear(next(iter(G.predecessors(node)))):
+            continue
+        chain = [node]
+        succ = next(iter(G.successors(node)))
+        while linear(succ):
+            chain.append(succ)
+            succ = next(iter(G.successors(succ)))
+        H.add_node(node, **G.nodes[node])
+        members[node] = chain
+    # linear nodes left over are on cycles of linear nodes, they are kept as they are
+    contracted = {member for chain in members.values() for member in chain}
+    for node, attrs in G.nodes(data=True):
+        if node not in contracted:
+            H.add_node(node, **attrs)
+            members[node] = [node]
+
+    head_of = {member: head for head, chain in members.items() for member in chain}
+    for u, v in G.edges():
+        hu, hv = head_of[u], head_of[v]
+        # a chain is entered at its first node and left from its last one, the edges inside it disappear
+        if hu != hv or len(members[hu]) == 1:
+            H.add_edge(hu, hv)
+    return H, members
+
+
+def compact_graph(G, sinks, sources):
+    """
+    Prune and contract G for the root-cause search from sources to sinks.
+    Inputs:
+    G: Diagnostics graph
+    sinks: System-level guarantee nodes that can be violated
+    sources: Component-level input nodes (candidate root causes)
+    Returns:
+    H: Compacted graph, sources and sinks of G that are on a path from a source to a sink keep their names
+    members: {node of H: [nodes of G it stands for]}, to report the original term and contract attributes
+    """
+    with span('compact_graph', **graph_size(G, 'input_')) as sp:
+        keep = set(sinks) | set(sources)
+        H, members = contract_chains(prune_graph(G, sinks, sources), keep)
+        sp.set(**graph_size(H))
+    return H, members
+
+
+def original_nodes(G, members, nodes):
+    """
+    (node, term, contract) in G of every original node behind nodes of the compacted graph.
+    """
+    return [(member, G.nodes[member]['term'], G.nodes[member]['contract']) for node in nodes for member in members[node]]
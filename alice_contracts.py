@@ -0,0 +1,83 @@
+"""
+Component contracts for the Alice example.
+
+width is the number of extra x/y/z pass-through variables of every component (100 by default).
+"""
+from pacti.contracts import PropositionalIoContract
+
+def guarantee_generator(clist, timestep, width=100):
+    """
+    Generate a list of guarantees for Alice's planning component, with width extra x <=> y guarantees.
+    """
+    guarantees = []
+
+    # for no changing cars, q has to stay the same
+    status = ''
+    for cx in clist:
+        status += f'({cx}_t{timestep} <=> {cx}_t{timestep-1}) & '
+    status = status[:-2]  # remove last '&'
+    for q in [1,2,3,4]:
+        guarantees.append(f'{status} & q_{q}_t{timestep-1} => q_{q}_t{timestep}')
+    
+    # guarantee generator for one changing car
+    for c in clist:
+        status = f'(~{c}_t{timestep} & {c}_t{timestep-1})'
+        for cx in clist:
+            if cx != c:
+                status += f' & ({cx}_t{timestep} <=> {cx}_t{timestep-1})'
+        for q in [2,3,4]:
+            guarantees.append(f'{status} & q_{q}_t{timestep-1} => q_{q-1}_t{timestep}')
+
+    # guarantee generator for two changing cars
+    for c in clist:
+        status = f'({c}_t{timestep} <=> {c}_t{timestep-1})'
+        for cx in clist:
+            if cx != c:
+                status += f' & (~{cx}_t{timestep} & {cx}_t{timestep-1})'
+        for q in [3,4]:
+            guarantees.append(f'{status} & q_{q}_t{timestep-1} => q_{q-2}_t{timestep}')
+
+    # guarantee generator for three changing cars
+    status = ''
+    for c in clist:
+        status += f'(~{c}_t{timestep} & {c}_t{timestep-1}) &'
+    status = status[:-2]  # remove last '&'
+    guarantees.append(f'{status} & q_4_t{timestep-1} => q_1_t{timestep}')
+    guarantees.append(f'(q_1_t{timestep} & ~q_2_t{timestep} & ~q_3_t{timestep} & ~q_4_t{timestep}) | (~q_1_t{timestep} & q_2_t{timestep} & ~q_3_t{timestep} & ~q_4_t{timestep}) | (~q_1_t{timestep} & ~q_2_t{timestep} & q_3_t{timestep} & ~q_4_t{timestep}) | (~q_1_t{timestep} & ~q_2_t{timestep} & ~q_3_t{timestep} & q_4_t{timestep})')
+
+    # extra guarantees (that don/t have to do with couting cars)
+    for i in range(width):
+        guarantees.append(f'x{i} <=> y{i}')
+
+    return guarantees
+
+def get_perception_contract(timestep, width=100):
+    extra_perception_out_vars = ['x'+str(i) for i in range(width)]
+    extra_guarantees = [f'{var}' for var in extra_perception_out_vars]
+    perception = PropositionalIoContract.from_strings(
+        input_vars=[f'car_l_T_t{timestep}', f'car_r_T_t{timestep}', f'car_s_T_t{timestep}', 'poor_visibility'],
+        output_vars=[f'car_l_P_t{timestep}', f'car_r_P_t{timestep}', f'car_s_P_t{timestep}']+extra_perception_out_vars,
+        assumptions=['~ poor_visibility'],
+        guarantees=[f'car_l_T_t{timestep} <=> car_l_P_t{timestep}', f'car_s_T_t{timestep} <=> car_s_P_t{timestep}', f'car_r_T_t{timestep} <=> car_r_P_t{timestep}']+extra_guarantees,)
+    return perception
+
+def get_planner_contract(timestep, width=100):
+    extra_planner_in_vars = ['x'+str(i) for i in range(width)]
+    extra_planner_out_vars = ['y'+str(i) for i in range(width)]
+    planner = PropositionalIoContract.from_strings(
+        input_vars=[f'car_l_P_t{timestep}', f'car_r_P_t{timestep}', f'car_s_P_t{timestep}', f'car_l_P_t{timestep-1}', f'car_r_P_t{timestep-1}', f'car_s_P_t{timestep-1}', f'q_1_t{timestep-1}', f'q_2_t{timestep-1}', f'q_3_t{timestep-1}', f'q_4_t{timestep-1}']+extra_planner_in_vars,
+        output_vars=[f'q_1_t{timestep}', f'q_2_t{timestep}', f'q_3_t{timestep}', f'q_4_t{timestep}']+extra_planner_out_vars,
+        assumptions=[f'(q_1_t{timestep-1} & ~q_2_t{timestep-1} & ~q_3_t{timestep-1} & ~q_4_t{timestep-1}) | (~q_1_t{timestep-1} & q_2_t{timestep-1} & ~q_3_t{timestep-1} & ~q_4_t{timestep-1}) | (~q_1_t{timestep-1} & ~q_2_t{timestep-1} & q_3_t{timestep-1} & ~q_4_t{timestep-1}) | (~q_1_t{timestep-1} & ~q_2_t{timestep-1} & ~q_3_t{timestep-1} & q_4_t{timestep-1})'],
+        guarantees=guarantee_generator(['car_l_P', 'car_r_P', 'car_s_P'], timestep, width))
+    return planner
+
+def get_tracker_contract(timestep, width=100):
+    extra_tracker_in_vars = ['y'+str(i) for i in range(width)]
+    extra_tracker_out_vars = ['z'+str(i)+'_'+str(timestep) for i in range(width)]
+    extra_guarantees = [f'y{i} <=> {var} ' for i,var in enumerate(extra_tracker_out_vars)]
+    tracker = PropositionalIoContract.from_strings(
+        input_vars=[f'q_1_t{timestep}', f'q_2_t{timestep}',f'q_3_t{timestep}', f'q_4_t{timestep}', 'icy_roads']+extra_tracker_in_vars,
+        output_vars=[f'v_t{timestep}']+extra_tracker_out_vars,
+        assumptions=['~icy_roads'],
+        guarantees=[f'q_1_t{timestep} <=> v_t{timestep}']+extra_guarantees)
+    return tracker
@@ -1,70 +1,399 @@
-from ipdb import set_trace as st
 import networkx as nx
+import numpy as np
 import copy
+import itertools
 import os
-from pacti.terms.propositions.propositions import _is_tautology, _subst_var, _expr_to_str
+from collections import OrderedDict
+from sympy.logic import boolalg
+from pacti.terms.propositions.propositions import PropositionalTerm, _is_tautology, _subst_var, _expr_to_str
+from alice_instrumentation import span, graph_size
+from alice_tracevalues import MAX_ENUMERATED
+
+
+# Compiled term evaluation
+# Python source of each boolean operator, on scalar values and on NumPy boolean arrays
+_SCALAR_OPS = {
+    boolalg.BooleanTrue: lambda args: 'True',
+    boolalg.BooleanFalse: lambda args: 'False',
+    boolalg.Not: lambda args: f'(not {args[0]})',
+    boolalg.And: lambda args: '(' + ' and '.join(args) + ')',
+    boolalg.Or: lambda args: '(' + ' or '.join(args) + ')',
+    boolalg.Implies: lambda args: f'((not {args[0]}) or {args[1]})',
+    # all arguments have the same truth value
+    boolalg.Equivalent: lambda args: '(' + ' == '.join(f'(not {a})' for a in args) + ')',
+    boolalg.Xor: lambda args: '(sum(not (not a) for a in (' + ', '.join(args) + ',)) % 2 == 1)',
+    boolalg.Nand: lambda args: '(not (' + ' and '.join(args) + '))',
+    boolalg.Nor: lambda args: '(not (' + ' or '.join(args) + '))',
+    boolalg.ITE: lambda args: f'({args[1]} if {args[0]} else {args[2]})',
+}
+_VECTOR_OPS = {
+    boolalg.BooleanTrue: lambda args: 'true_',
+    boolalg.BooleanFalse: lambda args: 'false_',
+    boolalg.Not: lambda args: f'(~{args[0]})',
+    boolalg.And: lambda args: '(' + ' & '.join(args) + ')',
+    boolalg.Or: lambda args: '(' + ' | '.join(args) + ')',
+    boolalg.Implies: lambda args: f'((~{args[0]}) | {args[1]})',
+    boolalg.Equivalent: lambda args: '(' + ' & '.join(f'({args[0]} == {a})' for a in args[1:]) + ')',
+    boolalg.Xor: lambda args: '(' + ' ^ '.join(args) + ')',
+    boolalg.Nand: lambda args: '(~(' + ' & '.join(args) + '))',
+    boolalg.Nor: lambda args: '(~(' + ' | '.join(args) + '))',
+    boolalg.ITE: lambda args: f'where({args[0]}, {args[1]}, {args[2]})',
+}
+_VECTOR_NAMESPACE = {'where': np.where, 'true_': np.True_, 'false_': np.False_}
+
+def _compile_expression(expr, argnames, ops=_SCALAR_OPS):
+    """
+    Translate a sympy boolean expression into Python source over the names in argnames.
+    """
+    def rec(e):
+        if e.is_Symbol:
+            return argnames[e.name]
+        op = ops.get(type(e))
+        if op is None:
+            raise ValueError(f'Cannot compile {type(e).__name__} expression')
+        return op([rec(a) for a in e.args])
+    return rec(expr)
+
+
+class CompiledTerm:
+    """
+    A propositional term compiled into a callable over its own support variables.
+    Calling it with a dict mapping variable names to values returns whether the term holds.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.support = tuple(sorted(s.name for s in expression.free_symbols))
+        self._argnames = {name: f'v{k}' for k, name in enumerate(self.support)}
+        try:
+            # Python source of the term over v0, v1, ... (the support in order), kept for precompiled artifacts
+            self.source = f'bool({_compile_expression(expression, self._argnames)})'
+            self._fn = eval(f'lambda {", ".join(self._argnames.values())}: {self.source}')
+        except (ValueError, RecursionError, SyntaxError):
+            self.source = None
+            self._fn = None
+        self._vector_fn = None
+
+    # largest number of unassigned variables checked by enumeration instead of substitution
+    max_enumerated = MAX_ENUMERATED
+
+    def __call__(self, values):
+        if self._fn is None:
+            return self._substitute(values)
+        try:
+            return self._fn(*[values[name] for name in self.support])
+        except KeyError:
+            pass
+        # partial assignment: the term holds if it is a tautology over the unassigned variables
+        missing = [k for k, name in enumerate(self.support) if name not in values]
+        if len(missing) > self.max_enumerated:
+            return self._substitute(values)
+        args = [values.get(name, 0) for name in self.support]
+        for assignment in itertools.product((0, 1), repeat=len(missing)):
+            for k, value in zip(missing, assignment):
+                args[k] = value
+            if not self._fn(*args):
+                return False
+        return True
+
+    def batch(self, columns, n):
+        """
+        Evaluate the term on n samples at once; columns maps variable names to boolean arrays of length n.
+        Returns a boolean array of length n.
+        """
+        if self._vector_fn is None and self._fn is not None:
+            body = _compile_expression(self.expression, self._argnames, _VECTOR_OPS)
+            self._vector_fn = eval(f'lambda {", ".join(self._argnames.values())}: {body}', dict(_VECTOR_NAMESPACE))
+        missing = [k for k, name in enumerate(self.support) if name not in columns]
+        if self._vector_fn is None or len(missing) > self.max_enumerated:
+            # evaluate sample by sample
+            present = [name for name in self.support if name in columns]
+            return np.array([self({name: columns[name][i] for name in present}) for i in range(n)], dtype=bool)
+        args = [columns.get(name) for name in self.support]
+        result = np.ones(n, dtype=bool)
+        for assignment in itertools.product((np.False_, np.True_), repeat=len(missing)):
+            for k, value in zip(missing, assignment):
+                args[k] = value
+            result &= np.broadcast_to(self._vector_fn(*args), (n,))
+        return result
+
+    def _substitute(self, values):
+        # unsupported operator or too many unassigned variables: substitute and check for a tautology
+        new_expr = copy.copy(self.expression)
+        for name in self.support:
+            if name in values:
+                new_expr = _subst_var(new_expr, name, values[name])
+        return _is_tautology(new_expr)
+
+
+class TermEvaluatorCache:
+    """
+    Bounded LRU cache of CompiledTerm objects keyed by the term's expression string.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._expression_keys = {}
+
+    def key(self, term):
+        """
+        Cache key of term (a PropositionalTerm or its expression string): the expression string.
+        """
+        if isinstance(term, str):
+            return term
+        # stringifying large expressions is costly, remember the key of expressions seen before
+        key = self._expression_keys.get(term.expression)
+        if key is None:
+            key = _expr_to_str(term.expression)
+            if len(self._expression_keys) >= self.maxsize:
+                self._expression_keys.clear()
+            self._expression_keys[term.expression] = key
+        return key
+
+    def get(self, term):
+        """
+        Return the compiled evaluator for term (a PropositionalTerm or its expression string).
+        """
+        key = self.key(term)
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compiled
+        self.misses += 1
+        expression = PropositionalTerm(term).expression if isinstance(term, str) else term.expression
+        compiled = CompiledTerm(expression)
+        self._entries[key] = compiled
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        self._entries.clear()
+        self._expression_keys.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+term_evaluators = TermEvaluatorCache()
+
+
+class TermIndex:
+    """
+    Index of the nodes of a diagnostics graph by term key (the expression string of the 'term' attribute),
+    with the parsed PropositionalTerm of every key. It is kept in G.graph['term_index'] and updated by
+    build_composition_graph, add_nodes_and_edges (and so connect_graphs) and TimestepTemplate.instantiate.
+    """
+    def __init__(self):
+        self.nodes = {}
+        self.terms = {}
+
+    def add(self, node, key, term=None):
+        self.nodes.setdefault(key, []).append(node)
+        if term is not None and key not in self.terms:
+            self.terms[key] = term
+
+    def remove(self, nodes):
+        """
+        Remove nodes (a set) from the index.
+        """
+        for key in list(self.nodes):
+            kept = [node for node in self.nodes[key] if node not in nodes]
+            if kept:
+                self.nodes[key] = kept
+            else:
+                del self.nodes[key]
+
+    def nodes_of(self, term):
+        """
+        Nodes with term (a PropositionalTerm or its key), in the order they were added.
+        """
+        return self.nodes.get(term_evaluators.key(term), [])
+
+    def term(self, key):
+        """
+        PropositionalTerm of key, parsed at most once.
+        """
+        term = self.terms.get(key)
+        if term is None:
+            term = self.terms[key] = PropositionalTerm(key)
+        return term
+
+    def __contains__(self, term):
+        return term_evaluators.key(term) in self.nodes
+
+
+def term_index(G):
+    """
+    TermIndex of G, built from the node attributes if G does not carry one.
+    """
+    index = G.graph.get('term_index')
+    if index is None:
+        index = G.graph['term_index'] = TermIndex()
+        for node, term in G.nodes(data='term'):
+            if term is not None:
+                index.add(node, str(term))
+    return index
+
+
+def system_guarantee_nodes(G):
+    """
+    Output guarantee nodes of the last composition of a diagnostics graph of unroll: full_system, or system_1
+    for a single timestep (which has no system-level composition).
+    Returns:
+    {term key: nodes with this term}, in the order of G
+    """
+    top = 'full_system' if any(contract == 'full_system' for _, contract in G.nodes(data='contract')) else None
+    nodes = {}
+    for node, attrs in G.nodes(data=True):
+        if attrs['type'] == 'guarantee' and attrs['output'] == 'True' and (attrs['contract'] == top or top is None and attrs['contract'].startswith('system_')):
+            nodes.setdefault(attrs['term'], []).append(node)
+    return nodes
+
+
+def behavior_values(behavior):
+    """
+    Convert a behavior {Var: value} into the {name: value} dict taken by compiled terms.
+    """
+    return {key if isinstance(key, str) else key.name: value for key, value in behavior.items()}
+
+
+def evaluate_term(term, values):
+    """
+    Evaluate term on values ({name: value}) using the shared evaluator cache.
+    """
+    return term_evaluators.get(term)(values)
+
+
+def contains_behavior(termlist, behavior):
+    """
+    Compiled equivalent of termlist.contains_behavior(behavior).
+    """
+    values = behavior_values(behavior)
+    return all(evaluate_term(term, values) for term in termlist.terms)
 
 
 # Check the behavior
 def check_guarantee(term, behavior):
+    return evaluate_term(term, behavior_values(behavior))
+
+
+def check_guarantee_subst(term, behavior):
+    """
+    Reference implementation of check_guarantee by substituting every behavior variable.
+    """
     new_expr = copy.copy(term.expression)
     for key in behavior.keys():
         new_expr = _subst_var(new_expr, key.name, behavior[key])
     return _is_tautology(new_expr)
 
 def build_composition_graph(G, prefix, contractdict, system_level=False):
-    G = nx.nx_agraph.to_agraph(G)
-    outputs = [i for i in G.nodes() if G.get_node(i).attr["output"] == "True"]
-    inputs = [i for i in G.nodes() if G.get_node(i).attr["input"] == "True"]
-    intersection = set(inputs).intersection(set(outputs))
-    internal_nodes = [i for i in G.nodes() if G.get_node(i).attr["input"] == "False" and G.get_node(i).attr["output"] == "False"]
-
-    G_mod = nx.DiGraph()
-    new_inputnodes = {}
-    new_outputnodes = {}
-    new_internal_nodes = {}
-    for i,node in enumerate(G.nodes()):
-        if node in intersection:
-            # if node is both input and output, create two nodes and connect them
-            G_mod.add_node(prefix+str(i)+'i', term=node, type = G.get_node(node).attr["type"], input="True", output="False", contract = contractdict[G.get_node(node).attr["component"]], system_level = system_level)
-            new_inputnodes.update({node: prefix+str(i)+'i'})
-            G_mod.add_node(prefix+str(i)+'o', term=node, type = G.get_node(node).attr["type"], input="False", output="True", contract =  contractdict["composition"], system_level = system_level)
-            new_outputnodes.update({node: prefix+str(i)+'o'})
-            G_mod.add_edge(prefix+str(i)+'i', prefix+str(i)+'o')  # connect the same terms
-        elif node in inputs:
-            G_mod.add_node(prefix+str(i)+'i', term=node, type = G.get_node(node).attr["type"], input="True", output="False", contract = contractdict[G.get_node(node).attr["component"]], system_level = system_level)
-            new_inputnodes.update({node: prefix+str(i)+'i'})
-        elif node in outputs:
-            G_mod.add_node(prefix+str(i)+'o', term=node, type = G.get_node(node).attr["type"], input="False", output="True", contract = contractdict["composition"], system_level = system_level)
-            new_outputnodes.update({node: prefix+str(i)+'o'})
-        elif node in internal_nodes:
-            G_mod.add_node(prefix+str(i), term=node, type = G.get_node(node).attr["type"], input="False", output="False", contract = "internal", system_level = system_level)
-            new_internal_nodes.update({node: prefix+str(i)})
-        
-    for u, v in G.edges():
-        if u in inputs and v in outputs:
-            # connect input to output
-            out_node = new_inputnodes[u]
-            in_node = new_outputnodes[v]
-            G_mod.add_edge(out_node, in_node)
-        elif u in inputs and v in internal_nodes:
-            # connect input to internal
-            out_node = new_inputnodes[u]
-            in_node = new_internal_nodes[v]
-            G_mod.add_edge(out_node, in_node)
-        elif u in internal_nodes and v in outputs:
-            # connect internal to output
-            out_node = new_internal_nodes[u]
-            in_node = new_outputnodes[v]
-            G_mod.add_edge(out_node, in_node)
-        elif u in internal_nodes and v in internal_nodes:
-            # connect internal to internal
-            out_node = new_internal_nodes[u]
-            in_node = new_internal_nodes[v]
-            G_mod.add_edge(out_node, in_node)
+    """
+    Build the composition graph from the diagnostics graph returned by compose_diagnostics.
+    Inputs:
+    G: networkx diagnostics graph of a composition, nodes are terms with input/output/type/component attributes
+    prefix: Prefix of the new node names (prefix+i+'i' for inputs, prefix+i+'o' for outputs)
+    contractdict: Names of the 'self', 'other' and 'composition' contracts
+    system_level: Value of the system_level attribute of the new nodes
+    Returns:
+    G_mod: Graph where input and output terms are separate nodes, labeled with their contracts.
+    """
+    with span('build_composition_graph', composition=contractdict['composition'], **graph_size(G, 'input_')) as sp:
+        G_mod = nx.DiGraph()
+        new_inputnodes = {}
+        new_outputnodes = {}
+        new_internal_nodes = {}
+
+        index = G_mod.graph['term_index'] = TermIndex()
+
+        def add_node(name, node, attrs, input, output, contract):
+            G_mod.add_node(name, term=node, type=attrs["type"], input=input, output=output, contract=contract, system_level=system_level)
+            index.add(name, node, parsed)
+
+        for i, (node, attrs) in enumerate(G.nodes(data=True)):
+            # the nodes of the diagnostics graph may be the terms themselves
+            parsed = node if isinstance(node, PropositionalTerm) else None
+            node = str(node)
+            attrs = _str_attrs(attrs)
+            is_input = attrs.get("input") == "True"
+            is_output = attrs.get("output") == "True"
+            if is_input:
+                new_inputnodes[node] = prefix+str(i)+'i'
+                add_node(new_inputnodes[node], node, attrs, "True", "False", contractdict[attrs["component"]])
+            if is_output:
+                new_outputnodes[node] = prefix+str(i)+'o'
+                add_node(new_outputnodes[node], node, attrs, "False", "True", contractdict["composition"])
+            if is_input and is_output:
+                # if node is both input and output, connect the two nodes of the same term
+                G_mod.add_edge(new_inputnodes[node], new_outputnodes[node])
+            elif attrs.get("input") == "False" and attrs.get("output") == "False":
+                new_internal_nodes[node] = prefix+str(i)
+                add_node(new_internal_nodes[node], node, attrs, "False", "False", "internal")
+
+        # edges leave input or internal nodes and enter output or internal nodes
+        sources = new_inputnodes | new_internal_nodes
+        targets = new_outputnodes | new_internal_nodes
+        edges = []
+        for u, v in G.edges():
+            out_node = sources.get(str(u))
+            in_node = targets.get(str(v))
+            if out_node is not None and in_node is not None:
+                edges.append((out_node, in_node))
+        G_mod.add_edges_from(edges)
 
+        sp.set(**graph_size(G_mod))
     return G_mod
 
+def _as_networkx(graph):
+    # pygraphviz graphs are still accepted, everything else is handled as networkx
+    if isinstance(graph, nx.Graph):
+        return graph
+    return nx.nx_agraph.from_agraph(graph)
+
+def _str_attrs(attrs):
+    # attributes are kept as strings, as they are after a pygraphviz round trip
+    return {key: str(value) for key, value in attrs.items()}
+
+def add_nodes_and_edges(G, graph):
+    """
+    Add the nodes and edges of graph to G, with string attributes, and index the new nodes by term.
+    """
+    index = term_index(G)
+    parsed = graph.graph.get('term_index')
+    parsed = parsed.terms if parsed is not None else {}
+    for u, attrs in graph.nodes(data=True):
+        u = str(u)
+        if u not in G and 'term' in attrs:
+            key = str(attrs['term'])
+            index.add(u, key, parsed.get(key))
+    G.add_nodes_from((str(u), _str_attrs(attrs)) for u, attrs in graph.nodes(data=True))
+    G.add_edges_from((str(u), str(v), _str_attrs(attrs)) for u, v, attrs in graph.edges(data=True))
+
+def feed_into(G, ingraph, outgraph):
+    """
+    Connect, in G, the output nodes of ingraph to the input nodes of outgraph with the same term and contract.
+    """
+    # join the output nodes of ingraph on the term index of outgraph
+    index = term_index(outgraph)
+    for u, attrs in ingraph.nodes(data=True):
+        if str(attrs["output"]) != "True":
+            continue
+        contract = str(attrs["contract"])
+        for v in index.nodes.get(str(attrs["term"]), ()):
+            v_attrs = outgraph.nodes.get(v)
+            if v_attrs is None or str(v_attrs["input"]) != "True" or str(v_attrs["contract"]) != contract:
+                continue
+            v = str(v)
+            # connect them in the G graph
+            G.add_edge(str(u), v)
+            # set input to false for the node that was connected
+            G.nodes[str(u)]['output'] = "False"
+            G.nodes[v]['input'] = "False"
+
 def connect_graphs(CompG, inG1, inG2 = None):
     """
     Connect a composition graph to a diagnostics graph.
@@ -75,60 +404,91 @@ def connect_graphs(CompG, inG1, inG2 = None):
     Returns:
     G: Diagnostics graph where the output of inG1 (and inG2) feeds into CompG.
     """
-    from ipdb import set_trace as st  
-
-    # create the new graph object
-    G = nx.DiGraph()
-
-    def add_nodes_and_edges(graph):
-        for u in graph.nodes():
-            attrs = dict(u.attr)
-            G.add_node(u, **attrs)
-        for edge in graph.edges():
-            source = edge[0]
-            target = edge[1]
-            attrs = dict(edge.attr)
-            G.add_edge(source, target, **attrs)
-
-    def feed_into(ingraph, outgraph):
-        # st()
-        outputnodes = [ingraph.get_node(u) for u in ingraph.nodes() if ingraph.get_node(u).attr["output"] == "True"]
-        inputnodes = [outgraph.get_node(v) for v in outgraph.nodes() if outgraph.get_node(v).attr["input"] == "True"]
-        for u in outputnodes:
-            # find the corresponding input node in G2
-            for v in inputnodes:
-                if ingraph.get_node(u).attr["term"] == outgraph.get_node(v).attr["term"] and ingraph.get_node(u).attr["contract"] == outgraph.get_node(v).attr["contract"]:
-                    # connect them in the G graph
-                    G.add_edge(u, v)
-                    # set input to false for the node that was connected
-                    G.nodes[u]['output'] = "False"
-                    G.nodes[v]['input'] = "False"
-    
-    try:
-        inG1 = nx.nx_agraph.to_agraph(inG1)
-    except:
-        pass
-    try:
-        CompG = nx.nx_agraph.to_agraph(CompG)
-    except:
-        pass
-
-    add_nodes_and_edges(inG1)
-    add_nodes_and_edges(CompG)
-    feed_into(inG1, CompG)
-    if inG2:
-        # st()
-        try:
-            inG2 = nx.nx_agraph.to_agraph(inG2)
-        except:
-            pass
-        add_nodes_and_edges(inG2)
-        feed_into(inG2, CompG)
-    # st()
+    with span('connect_graphs') as sp:
+        # create the new graph object
+        G = nx.DiGraph()
+
+        inG1 = _as_networkx(inG1)
+        CompG = _as_networkx(CompG)
+
+        add_nodes_and_edges(G, inG1)
+        add_nodes_and_edges(G, CompG)
+        feed_into(G, inG1, CompG)
+        if inG2:
+            inG2 = _as_networkx(inG2)
+            add_nodes_and_edges(G, inG2)
+            feed_into(G, inG2, CompG)
+        sp.set(**graph_size(G))
     return G
 
 
-def plot_graph(G, filename):
+class ReachabilityIndex:
+    """
+    Reachability from a fixed set of source nodes in a diagnostics graph, built in one pass.
+    Every node stores the sources that reach it as a bitset (compressed transitive closure over
+    the condensation of G), so a query costs one lookup per sink instead of one search per pair.
+    Inputs:
+    G: Diagnostics graph
+    sources: Candidate source nodes (e.g. component-level input nodes), in reporting order
+    """
+    def __init__(self, G, sources):
+        with span('reachability_index', **graph_size(G)) as sp:
+            self.sources = list(dict.fromkeys(sources))
+            bit = {src: 1 << k for k, src in enumerate(self.sources)}
+            C = nx.condensation(G)
+            members = C.graph['mapping']
+            reach = {}
+            for c in nx.topological_sort(C):
+                bits = 0
+                for node in C.nodes[c]['members']:
+                    bits |= bit.get(node, 0)
+                for pred in C.predecessors(c):
+                    bits |= reach[pred]
+                reach[c] = bits
+            self._bits = {node: reach[c] for node, c in members.items()}
+            sp.set(sources=len(self.sources))
+
+    def _decode(self, bits):
+        sources = []
+        while bits:
+            low = bits & -bits
+            sources.append(self.sources[low.bit_length() - 1])
+            bits ^= low
+        return sources
+
+    def bits(self, sink):
+        """
+        Sources with a path to sink as a bitset, bit k standing for self.sources[k].
+        """
+        return self._bits.get(sink, 0)
+
+    def reaches(self, src, sink):
+        return src in self.sources and bool(self._bits.get(sink, 0) >> self.sources.index(src) & 1)
+
+    def sources_of(self, sink):
+        """
+        Sources with a path to sink, in the order given at construction.
+        """
+        return self._decode(self._bits.get(sink, 0))
+
+    def relevant_sources(self, sinks):
+        """
+        Sources with a path to any of sinks, ordered by first sink reached and then source order.
+        """
+        seen = 0
+        sources = []
+        for sink in sinks:
+            new_bits = self._bits.get(sink, 0) & ~seen
+            sources += self._decode(new_bits)
+            seen |= new_bits
+        return sources
+
+
+def plot_graph(G, filename, directory="imgs"):
+    if 'term_index' in G.graph:
+        # graph attributes become dot attributes
+        G = nx.DiGraph(G)
+        del G.graph['term_index']
     G_agr = nx.nx_agraph.to_agraph(G)
     # G_agr, mapping = postprocess(G2, graphstr, contracts, system_level)
     # Set left-to-right layout
@@ -138,7 +498,6 @@ def plot_graph(G, filename):
 
     for i in G_agr.nodes():
         n = G_agr.get_node(i)
-        # st()
         n.attr['shape'] = 'box'
         n.attr['fillcolor'] = '#ffffff'  # default color white
         n.attr['alpha'] = 0.6
@@ -160,6 +519,7 @@ def plot_graph(G, filename):
         sg_out = G_agr.add_subgraph(outputs, name="cluster_outputs")
         sg_out.graph_attr["rank"] = "same"
 
-    if not os.path.exists("imgs"):
-        os.makedirs("imgs")
-    G_agr.draw("imgs/"+filename+".pdf", prog='dot')
\ No newline at end of file
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with span('render', filename=filename, **graph_size(G)):
+        G_agr.draw(os.path.join(directory, filename+".pdf"), prog='dot')
\ No newline at end of file
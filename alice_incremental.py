@@ -0,0 +1,188 @@
+"""
+Incremental recomposition of the Alice system after a component contract changes.
+
+The diagnostics graph G of unroll is the union of regions: the graph of every timestep and the graph of every
+system-level composition (layer k composes timesteps 1..k-1 with timestep k), joined by feed_into between a
+layer and its two children. IncrementalSystem tracks what each region depends on:
+
+- a timestep template (sequenced or final) depends on the contract factories of its components, and its two
+  compositions are looked up by content in a MemoryCache, so changing the tracker does not recompose
+  perception and planner;
+- a timestep depends on its template, and is renamed again only when the template was rebuilt;
+- a layer depends on the system contracts of its children (by composition_key), and is composed again only if
+  one of them changed.
+
+Replacing a component recomputes the regions depending on it, removes their old nodes from G, adds the new ones
+and runs feed_into again for the connections touching them. The resulting G has the same nodes, attributes
+and edges as a full unroll with the same components.
+"""
+import networkx as nx
+from alice_cache import MemoryCache, composition_key
+from alice_helperfunctions import add_nodes_and_edges, feed_into, term_index
+from alice_instrumentation import span, graph_size
+from alice_unrolling import COMPONENTS, Span, TimestepTemplate, compose_spans
+
+
+class IncrementalSystem:
+    """
+    The Alice system over timesteps 1..horizon, as composed by unroll, recomposed incrementally when the
+    contract of a component changes.
+    Inputs:
+    horizon: Number of timesteps
+    width: Number of extra x/y/z variables of the components
+    cache: Optional CompositionCache for all compositions
+    After every update, full_sys, G and timesteps are those unroll returns for the current components.
+    """
+    def __init__(self, horizon, width=100, cache=None):
+        self.horizon = horizon
+        self.width = width
+        self.cache = cache
+        # contract factories of the sequenced (False) and of the final (True) timesteps
+        self.components = {False: dict(COMPONENTS), True: dict(COMPONENTS)}
+        self.full_sys = None
+        self.G = None
+        self.timesteps = []
+        self._templates = {}
+        self._layers = []
+        self._regions = {}
+        self.update()
+
+    def replace(self, component, factory, final=None):
+        """
+        Replace the contract of component and recompose what depends on it.
+        Inputs:
+        component: 'perception', 'planner' or 'tracker'
+        factory: Function (timestep, width) -> contract
+        final: Replace it in the sequenced timesteps only (False), the final timestep only (True) or both (None)
+        Returns:
+        See update
+        """
+        if component not in COMPONENTS:
+            raise ValueError(f'unknown component {component}, expected one of {list(COMPONENTS)}')
+        for kind in ([False, True] if final is None else [final]):
+            self.components[kind][component] = factory
+        return self.update()
+
+    def update(self):
+        """
+        Recompose the regions depending on components changed since the last update and splice them into G.
+        Returns:
+        Counts of rebuilt templates, of compositions run and reused, of renamed timesteps, of composed and
+        reused layers, and of nodes removed from and added to G.
+        """
+        with span('incremental_update', horizon=self.horizon, width=self.width) as sp:
+            stats = {'templates': 0, 'compositions': 0, 'reused_compositions': 0, 'timesteps': 0,
+                     'layers': 0, 'reused_layers': 0}
+            rebuilt = self._update_templates(stats)
+
+            # timesteps of rebuilt templates are renamed again
+            changed = set()
+            timesteps = []
+            for k in range(1, self.horizon + 1):
+                final = k == self.horizon
+                if k <= len(self.timesteps) and final not in rebuilt:
+                    timesteps.append(self.timesteps[k-1])
+                    continue
+                timesteps.append(self._templates[final][1].instantiate(k))
+                changed.add(('timestep', k))
+                stats['timesteps'] += 1
+
+            # layer k composes timesteps 1..k-1 with timestep k, again only if one of their contracts changed
+            spans = [Span(step.timestep, step.timestep, f'system_{step.timestep}', step.sys, step.G) for step in timesteps]
+            layers = []
+            acc, acc_id = spans[0], ('timestep', 1)
+            for k in range(2, self.horizon + 1):
+                old = self._layers[k-2] if k-2 < len(self._layers) else None
+                if old is not None and acc_id not in changed and ('timestep', k) not in changed:
+                    key, layer = old
+                else:
+                    key = composition_key(acc.sys, spans[k-1].sys)
+                    if old is not None and old[0] == key:
+                        layer = old[1]
+                    else:
+                        layer = compose_spans(acc, spans[k-1], k == self.horizon, self.cache)
+                        changed.add(('layer', k))
+                if ('layer', k) in changed:
+                    stats['layers'] += 1
+                else:
+                    stats['reused_layers'] += 1
+                layers.append((key, layer))
+                acc, acc_id = layer, ('layer', k)
+
+            stats.update(self._splice(timesteps, layers, changed))
+            self.timesteps = timesteps
+            self._layers = layers
+            self.full_sys = acc.sys
+            sp.set(**stats, **graph_size(self.G))
+        return stats
+
+    def _update_templates(self, stats):
+        # rebuild the templates whose component factories changed, reusing the unchanged compositions
+        rebuilt = set()
+        for final in ([False] if self.horizon > 1 else []) + [True]:
+            factories = self.components[final]
+            current = self._templates.get(final)
+            if current is not None and current[0] == factories:
+                continue
+            memo = current[2] if current is not None else MemoryCache(self.cache)
+            hits, misses = memo.hits, memo.misses
+            template = TimestepTemplate(self.horizon if final else 1, final, memo, self.width, factories)
+            memo.collect()
+            self._templates[final] = (dict(factories), template, memo)
+            stats['templates'] += 1
+            stats['compositions'] += memo.misses - misses
+            stats['reused_compositions'] += memo.hits - hits
+            rebuilt.add(final)
+        return rebuilt
+
+    def _splice(self, timesteps, layers, changed):
+        # regions in the order unroll adds them, and the (child, layer) connections between them
+        regions = {('timestep', 1): timesteps[0].G}
+        connections = []
+        for k in range(2, self.horizon + 1):
+            regions[('layer', k)] = layers[k-2][1].G
+            regions[('timestep', k)] = timesteps[k-1].G
+            child = ('timestep', 1) if k == 2 else ('layer', k-1)
+            connections += [(child, ('layer', k)), (('timestep', k), ('layer', k))]
+
+        if self.G is None:
+            self.G = nx.DiGraph()
+        G = self.G
+        removed = set()
+        for region in changed:
+            old = self._regions.get(region)
+            if old is not None:
+                removed.update(old.nodes)
+        G.remove_nodes_from(removed)
+        term_index(G).remove(removed)
+        added = 0
+        for region, graph in regions.items():
+            if region in changed:
+                add_nodes_and_edges(G, graph)
+                added += graph.number_of_nodes()
+
+        # feed_into only turns input and output attributes to False: reset them on the unchanged neighbours
+        # of the changed regions and connect again every connection touching these regions
+        affected = set(changed)
+        for child, layer in connections:
+            if child in changed or layer in changed:
+                affected.update((child, layer))
+        for region in affected - changed:
+            for node, attrs in regions[region].nodes(data=True):
+                G.nodes[node]['input'] = str(attrs['input'])
+                G.nodes[node]['output'] = str(attrs['output'])
+        for child, layer in connections:
+            if child in affected or layer in affected:
+                feed_into(G, regions[child], regions[layer])
+
+        self._regions = regions
+        return {'removed_nodes': len(removed), 'added_nodes': added}
+
+    def compile_artifact(self, path):
+        """
+        Write the diagnosis artifact of the current system to path (see alice_artifact.py).
+        """
+        from alice_artifact import Artifact, artifact_data, write_artifact
+        data = artifact_data(self.full_sys, self.G, self.horizon, self.width)
+        write_artifact(path, data)
+        return Artifact(data)
@@ -0,0 +1,270 @@
+"""
+Instrumentation of the diagnosis pipeline.
+
+Every stage of the pipeline (compose_diagnostics, build_composition_graph, connect_graphs, rendering, the
+system-level checks, the reachability search and the second-stage checks) runs in a span. Spans are passed
+to the registered hooks; without hooks, span() returns a shared no-op object and nothing is measured.
+
+A hook may implement start(span) and end(span), to measure a span and add fields to it, and emit(record), to
+write the finished record: a dict with the stage, span id, parent span id, process id, start time, duration,
+error and the fields of the span (graph sizes, term counts, cache hits and misses).
+
+JsonLinesHook writes one JSON line per span, ProfileHook captures cProfile or tracemalloc data around the
+spans of one stage. Setting ALICE_TRACE to a file name (or - for stderr) registers a JsonLinesHook.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_hooks = []
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Span:
+    """
+    One run of a stage. Fields are set with set(), counters of caches (objects with hits and misses) are
+    tracked with track() and recorded as differences when the span ends. Lazy field values (see graph_size)
+    are computed when they are set.
+    """
+    enabled = True
+
+    def __init__(self, stage, fields):
+        self.stage = stage
+        self.fields = _evaluate(fields)
+        self.id = next(_ids)
+        self.parent = None
+        self.start = None
+        self.duration = None
+        self.error = None
+        self._counters = []
+
+    def set(self, **fields):
+        self.fields.update(_evaluate(fields))
+
+    def track(self, name, counter):
+        if counter is not None:
+            self._counters.append((name, counter, counter.hits, counter.misses))
+
+    def record(self):
+        return {'stage': self.stage, 'id': self.id, 'parent': self.parent, 'pid': os.getpid(), 'start': self.start,
+                'duration': self.duration, 'error': self.error, **self.fields}
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].id if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        for hook in list(_hooks):
+            hook.start(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        for name, counter, hits, misses in self._counters:
+            self.fields[f'{name}_hits'] = counter.hits - hits
+            self.fields[f'{name}_misses'] = counter.misses - misses
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        hooks = list(_hooks)
+        for hook in hooks:
+            hook.end(self)
+        record = self.record()
+        for hook in hooks:
+            hook.emit(record)
+        return False
+
+
+class _NullSpan:
+    enabled = False
+
+    def set(self, **fields):
+        pass
+
+    def track(self, name, counter):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage, **fields):
+    """
+    Context manager measuring one run of stage, a no-op when no hook is registered.
+    """
+    if not _hooks:
+        return _NULL_SPAN
+    return Span(stage, fields)
+
+
+def enabled():
+    return bool(_hooks)
+
+
+class _Lazy:
+    # field value computed only by an enabled span
+    def __init__(self, fn):
+        self.fn = fn
+
+
+def _evaluate(fields):
+    return {name: value.fn() if isinstance(value, _Lazy) else value for name, value in fields.items()}
+
+
+def graph_size(G, prefix=''):
+    """
+    Fields with the number of nodes and edges of G, counted only if the span they are passed to is enabled.
+    """
+    return {f'{prefix}nodes': _Lazy(G.number_of_nodes), f'{prefix}edges': _Lazy(G.number_of_edges)}
+
+
+class Hook:
+    """
+    Base class of the hooks, all methods are optional.
+    """
+    def start(self, span):
+        pass
+
+    def end(self, span):
+        pass
+
+    def emit(self, record):
+        pass
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+@contextmanager
+def hooks(*added):
+    """
+    Register hooks for the duration of a with block.
+    """
+    for hook in added:
+        add_hook(hook)
+    try:
+        yield added
+    finally:
+        for hook in added:
+            remove_hook(hook)
+
+
+class JsonLinesHook(Hook):
+    """
+    Write every finished span as one JSON line to target, a path (opened in append mode on the first record)
+    or a file object.
+    """
+    def __init__(self, target=sys.stderr):
+        self.target = target
+        self._file = None if isinstance(target, (str, os.PathLike)) else target
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.target, 'a')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None and self._file is not self.target:
+            self._file.close()
+        self._file = None if isinstance(self.target, (str, os.PathLike)) else self.target
+
+
+class ProfileHook(Hook):
+    """
+    Capture cProfile (mode='cprofile') or tracemalloc (mode='tracemalloc') data around every outermost span of
+    stage. The limit top entries (cumulative time, or allocated size by line) are added to the span as the
+    profile field; with a directory, the full data is also written to {directory}/{stage}-{span id}.prof
+    (cProfile stats) or .txt (tracemalloc statistics).
+    """
+    def __init__(self, stage, mode='cprofile', directory=None, limit=20):
+        if mode not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f'Unknown profile mode {mode}')
+        self.stage = stage
+        self.mode = mode
+        self.directory = directory
+        self.limit = limit
+        self._active = None
+        self._profile = None
+        self._started_tracing = False
+
+    def start(self, span):
+        if span.stage != self.stage or self._active is not None:
+            return
+        self._active = span
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._traced_before = tracemalloc.get_traced_memory()[0]
+
+    def end(self, span):
+        if span is not self._active:
+            return
+        self._active = None
+        path = os.path.join(self.directory, f'{span.stage}-{span.id}') if self.directory else None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if self.mode == 'cprofile':
+            self._profile.disable()
+            out = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(self.limit)
+            if path:
+                stats.dump_stats(path + '.prof')
+                span.set(profile_file=path + '.prof')
+            span.set(profile=out.getvalue().splitlines())
+            self._profile = None
+        else:
+            peak = tracemalloc.get_traced_memory()[1] - self._traced_before
+            statistics = tracemalloc.take_snapshot().statistics('lineno')
+            if self._started_tracing:
+                tracemalloc.stop()
+            if path:
+                with open(path + '.txt', 'w') as f:
+                    f.writelines(f'{stat}\n' for stat in statistics)
+                span.set(profile_file=path + '.txt')
+            span.set(peak_bytes=peak, profile=[str(stat) for stat in statistics[:self.limit]])
+
+
+if os.environ.get('ALICE_TRACE'):
+    add_hook(JsonLinesHook(sys.stderr if os.environ['ALICE_TRACE'] == '-' else os.environ['ALICE_TRACE']))
@@ -0,0 +1,215 @@
+"""
+Online monitoring of live traces.
+
+Records arrive one timestep at a time, from a generator or from a JSON lines or CSV file or pipe. Each record
+maps variable names (as in system_trace.py, e.g. car_l_T_t1) to values, with an optional 'timestep' entry.
+A system guarantee is evaluated as soon as the last of its variables is assigned, and a violation is reported
+right away with the component-level suspects from the diagnostics graph.
+
+With slide=True the system contract (composed over a fixed horizon) is re-instantiated at every timestep
+offset, so drives longer than the horizon are monitored with a sliding window. Values and pending
+guarantees older than the window are dropped, so memory does not grow with the length of the drive. Without
+slide, only the instance at offset 0 is monitored, and values it does not read are not kept.
+"""
+import csv
+import json
+import os
+import sys
+from collections import namedtuple
+from pacti.terms.propositions.propositions import PropositionalTerm, _expr_to_str
+from alice_tracevalues import parse_value
+from alice_helperfunctions import term_evaluators, term_index, system_guarantee_nodes, ReachabilityIndex
+from alice_unrolling import shift_symbols, shift_timestep, _TIMESTEP_SUFFIX
+
+# offset: timestep offset of the contract instance, index: position of the guarantee in full_sys.g.terms,
+# term: the guarantee in the instance, node: system-level node of the guarantee in G (the nodes of G are
+# those of offset 0), suspects: (node, term, contract) of the component-level inputs feeding it, terms and
+# contract names shifted by offset
+Violation = namedtuple('Violation', ['timestep', 'offset', 'index', 'term', 'node', 'suspects'])
+
+
+def _timestep_of(name):
+    m = _TIMESTEP_SUFFIX.match(name)
+    return int(m.group(3)) if m else None
+
+
+def _shift_term(term, offset):
+    # term of the contract instance at offset, renamed as TimestepTemplate.instantiate renames the timesteps
+    if offset == 0:
+        return term
+    return PropositionalTerm(term.expression.xreplace(shift_symbols([term.expression], offset)))
+
+
+class _Instance:
+    def __init__(self, offset, names):
+        self.offset = offset
+        self.names = names
+        self.remaining = [0] * len(names)
+        self.pending = len(names)
+
+
+class OnlineMonitor:
+    """
+    Incremental evaluation of the system guarantees of full_sys on a stream of records.
+    Inputs:
+    full_sys: System contract
+    G: Diagnostics graph of full_sys
+    component_level_input_nodes: Candidate root-cause nodes in G
+    slide: Re-instantiate the contract at every timestep offset (for drives longer than its horizon)
+    window: Number of timesteps a pending guarantee waits for missing values (the horizon by default)
+    reachability: ReachabilityIndex of G over component_level_input_nodes (built if not given)
+    """
+    def __init__(self, full_sys, G, component_level_input_nodes, slide=False, window=None, reachability=None):
+        self.terms = full_sys.g.terms
+        self.compiled = [term_evaluators.get(term) for term in self.terms]
+        self.G = G
+        self.reachability = reachability or ReachabilityIndex(G, component_level_input_nodes)
+        self.slide = slide
+
+        # output guarantee node of every guarantee term in the last composition
+        guarantee_nodes = system_guarantee_nodes(G)
+        self.nodes = [guarantee_nodes.get(term_evaluators.key(term), [None])[0] for term in self.terms]
+        self.index = term_index(G)
+
+        steps = [t for compiled in self.compiled for t in map(_timestep_of, compiled.support) if t is not None]
+        self.t_min = min(steps, default=0)
+        self.t_max = max(steps, default=0)
+        self.window = window if window is not None else self.t_max - self.t_min + 1
+
+        self.timestep = None
+        self.values = {}
+        self.evaluated = 0
+        self.expired = 0
+        self._instances = {}
+        self._next_offset = 0
+        self._waiting = {}
+        self._suspects = {}
+
+    def push(self, record):
+        """
+        Consume one record and return the Violations it reveals.
+        """
+        record = dict(record)
+        k = record.pop('timestep', None)
+        if k is None:
+            k = max((t for t in map(_timestep_of, record) if t is not None), default=self.timestep or 0)
+        self.timestep = k if self.timestep is None else max(self.timestep, k)
+
+        violations = []
+        # without slide, once instance 0 has started, only the values it waits for are read
+        keep = self.slide or self._next_offset == 0
+        for name, value in record.items():
+            waiting = self._waiting.pop(name, ())
+            if keep or waiting:
+                self.values[name] = value
+            for offset, j in waiting:
+                instance = self._instances.get(offset)
+                if instance is None:
+                    continue
+                instance.remaining[j] -= 1
+                if instance.remaining[j] == 0:
+                    self._evaluate(instance, j, violations)
+
+        # start the contract instances whose first timestep has been reached
+        last_offset = self.timestep - self.t_min if self.slide else 0
+        while self._next_offset <= last_offset:
+            self._start(self._next_offset, violations)
+            self._next_offset += 1
+
+        self._evict()
+        return violations
+
+    def _start(self, offset, violations):
+        names = [[shift_timestep(name, offset) for name in compiled.support] for compiled in self.compiled]
+        instance = _Instance(offset, names)
+        self._instances[offset] = instance
+        for j, shifted in enumerate(names):
+            missing = [name for name in shifted if name not in self.values]
+            instance.remaining[j] = len(missing)
+            for name in missing:
+                self._waiting.setdefault(name, []).append((offset, j))
+            if not missing:
+                self._evaluate(instance, j, violations)
+
+    def _evaluate(self, instance, j, violations):
+        compiled = self.compiled[j]
+        values = {name: self.values[shifted] for name, shifted in zip(compiled.support, instance.names[j])}
+        self.evaluated += 1
+        instance.pending -= 1
+        if not compiled(values):
+            violations.append(Violation(self.timestep, instance.offset, j, _shift_term(self.terms[j], instance.offset),
+                                        self.nodes[j], self.suspects(j, instance.offset)))
+        if instance.pending == 0:
+            del self._instances[instance.offset]
+
+    def suspects(self, j, offset=0):
+        """
+        Component-level inputs feeding guarantee j, as (node, term, contract) with terms and contracts shifted by offset.
+        """
+        if j not in self._suspects:
+            node = self.nodes[j]
+            sources = self.reachability.sources_of(node) if node is not None else []
+            self._suspects[j] = [(src, self.G.nodes[src]['term'], self.G.nodes[src]['contract']) for src in sources]
+        if offset == 0:
+            return list(self._suspects[j])
+        return [(src, _expr_to_str(_shift_term(self.index.term(term), offset).expression), shift_timestep(contract, offset))
+                for src, term, contract in self._suspects[j]]
+
+    def _evict(self):
+        # give up on instances whose last timestep is more than window timesteps old
+        oldest = self.timestep - self.window
+        for offset in [o for o in self._instances if self.t_max + o < oldest]:
+            instance = self._instances.pop(offset)
+            for j, shifted in enumerate(instance.names):
+                if instance.remaining[j] > 0:
+                    self.expired += 1
+                    for name in shifted:
+                        waiting = self._waiting.get(name)
+                        if waiting is not None:
+                            waiting[:] = [w for w in waiting if w[0] != offset]
+                            if not waiting:
+                                del self._waiting[name]
+        # drop values no live or future instance can read
+        if not self.slide and not self._instances and self._next_offset > 0:
+            self.values.clear()
+            return
+        first_needed = min([*self._instances, self._next_offset]) + self.t_min
+        for name in [name for name in self.values if (_timestep_of(name) is not None and _timestep_of(name) < first_needed)]:
+            del self.values[name]
+
+
+def read_records(source, format=None):
+    """
+    Yield records from source: an iterable of dicts, a file object, a path, or '-' for stdin.
+    Files are JSON lines (one object per line) or CSV (a header of variable names, one row per timestep,
+    empty cells unassigned, cells are integers or true/false); format is 'jsonl' or 'csv', taken from the
+    file extension by default.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if format is None:
+            format = 'csv' if str(source).endswith('.csv') else 'jsonl'
+        if source == '-':
+            yield from read_records(sys.stdin, format)
+            return
+        with open(source, newline='') as f:
+            yield from read_records(f, format)
+        return
+    if not hasattr(source, 'read'):
+        yield from source
+        return
+    if format == 'csv':
+        for row in csv.DictReader(source):
+            yield {key: parse_value(value, key) for key, value in row.items() if value not in (None, '')}
+    else:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def monitor(records, full_sys, G, component_level_input_nodes, **kwargs):
+    """
+    Yield Violations as they appear in records (see read_records), kwargs are passed to OnlineMonitor.
+    """
+    online = OnlineMonitor(full_sys, G, component_level_input_nodes, **kwargs)
+    for record in read_records(records):
+        yield from online.push(record)
@@ -0,0 +1,105 @@
+"""
+Deferred rendering of diagnostics graphs.
+
+Graphviz dot layouts are superlinear in the size of the graph, so they are kept off the diagnosis path: a
+Renderer queues render requests to a pool of background worker processes, skips graphs above a node budget,
+and can render only the part of a graph relevant to the violated guarantees.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import networkx as nx
+from alice_helperfunctions import plot_graph
+from alice_instrumentation import span
+
+
+def relevant_subgraph(G, sinks, sources=None):
+    """
+    Subgraph of G on the paths into sinks (e.g. the violated system-level guarantee nodes), from sources
+    (e.g. the component-level inputs to check) if given.
+    """
+    nodes = set(sinks)
+    for sink in sinks:
+        nodes |= nx.ancestors(G, sink)
+    if sources is not None:
+        downstream = set(sources)
+        for src in sources:
+            if src in nodes:
+                downstream |= nx.descendants(G, src)
+        nodes = (nodes & downstream) | set(sinks)
+    return G.subgraph(nodes)
+
+
+def _render(G, filename, directory):
+    plot_graph(G, filename, directory)
+    return os.path.join(directory, filename + '.pdf')
+
+
+class Renderer:
+    """
+    Background rendering of graphs to {directory}/{filename}.pdf.
+    Inputs:
+    processes: Number of worker processes (0 renders in the calling process when submitted)
+    max_nodes: Graphs with more nodes are skipped (None for no limit)
+    directory: Output directory
+    """
+    def __init__(self, processes=1, max_nodes=1000, directory='imgs'):
+        self.processes = processes
+        self.max_nodes = max_nodes
+        self.directory = directory
+        self.rendered = []
+        self.skipped = []
+        self._pool = None
+        self._pending = []
+
+    def submit(self, G, filename, nodes=None):
+        """
+        Queue the rendering of G (or of its subgraph induced by nodes).
+        Returns:
+        False if the graph is over the node budget, True otherwise.
+        """
+        if nodes is not None:
+            G = G.subgraph(nodes)
+        n = G.number_of_nodes()
+        if self.max_nodes is not None and n > self.max_nodes:
+            with span('render_skipped', filename=filename, nodes=n, max_nodes=self.max_nodes):
+                self.skipped.append((filename, n))
+            return False
+        # snapshot, the caller may keep changing G
+        G = nx.DiGraph(G)
+        G.graph.pop('term_index', None)
+        if not self.processes:
+            self.rendered.append(_render(G, filename, self.directory))
+            return True
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.processes)
+        self._pending.append(self._pool.submit(_render, G, filename, self.directory))
+        return True
+
+    def submit_relevant(self, G, filename, sinks, sources=None):
+        """
+        Queue the rendering of the subgraph of G relevant to sinks (see relevant_subgraph).
+        """
+        return self.submit(relevant_subgraph(G, sinks, sources), filename)
+
+    def wait(self):
+        """
+        Wait for the queued renderings, return the paths of all rendered files.
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            self.rendered.append(future.result())
+        return self.rendered
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
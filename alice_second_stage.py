@@ -0,0 +1,161 @@
+"""
+Lazy second-stage checks of component guarantees.
+
+After the root-cause search, the component-level guarantees in to_check are evaluated on the observed trace
+and on internal variables, which are expensive to pull from the vehicle logs. The checks here are
+deduplicated by term, the cheapest ones (fewest internal variables still to fetch) run first, internal
+variables are fetched on demand through a callback, and with stop_early the checks stop as soon as the
+violated component guarantees found explain every violated system-level guarantee.
+"""
+import heapq
+from collections import namedtuple
+from alice_helperfunctions import term_evaluators, term_index, CompiledTerm
+from alice_instrumentation import span
+
+# term: term key, nodes: to_check nodes with this term, status: 'violated', 'satisfied' or 'unknown' (holds for
+# some but not all values of the variables that could not be fetched), fetched: variables fetched for the check
+CheckResult = namedtuple('CheckResult', ['term', 'nodes', 'status', 'fetched'])
+
+
+def fetch_from(trace, sample=0):
+    """
+    Fetch callback reading one sample of a columnar trace {name: [v_0, ...]} (e.g. get_internal_system_trace).
+    """
+    def fetch(names):
+        return {name: trace[name][sample] for name in names if name in trace}
+    return fetch
+
+
+def explained_sinks(reachability, violated_nodes):
+    """
+    {source: violated system-level nodes it reaches} for the sources of a ReachabilityIndex.
+    """
+    explains = {}
+    for sink in violated_nodes:
+        for src in reachability.sources_of(sink):
+            explains.setdefault(src, set()).add(sink)
+    return explains
+
+
+class SecondStage:
+    """
+    Evaluation of component guarantees with internal variables fetched on demand.
+    Inputs:
+    G: Diagnostics graph
+    values: Observed values {name: value}
+    fetch: Callback taking a list of variable names and returning {name: value} for the ones it can provide
+    """
+    def __init__(self, G, values, fetch=None):
+        self.G = G
+        self.index = term_index(G)
+        self.values = dict(values)
+        self.fetch = fetch
+        self.fetched = []
+        self.fetch_calls = 0
+        self.unavailable = set()
+        self.explanation = None
+        self._negations = {}
+
+    def _missing(self, compiled):
+        return [name for name in compiled.support if name not in self.values and name not in self.unavailable]
+
+    def _fetch(self, names):
+        if not names:
+            return []
+        if self.fetch is None:
+            self.unavailable.update(names)
+            return []
+        self.fetch_calls += 1
+        got = self.fetch(names)
+        fetched = [name for name in names if name in got]
+        for name in fetched:
+            self.values[name] = got[name]
+        self.fetched += fetched
+        self.unavailable.update(name for name in names if name not in got)
+        return fetched
+
+    def _status(self, compiled):
+        if compiled(self.values):
+            return 'satisfied'
+        if all(name in self.values for name in compiled.support):
+            return 'violated'
+        # some variables could not be fetched: violated only if the term fails for all their values
+        negation = self._negations.get(compiled)
+        if negation is None:
+            negation = self._negations[compiled] = CompiledTerm(~compiled.expression)
+        return 'violated' if negation(self.values) else 'unknown'
+
+    def run(self, to_check, explains=None, stop_early=False):
+        """
+        Check the terms of the nodes in to_check.
+        Inputs:
+        to_check: Component-level input nodes of G to check
+        explains: {node: violated system-level nodes it reaches} (see explained_sinks), needed for stop_early
+        stop_early: Stop when the violated checks explain every violated system-level node; checks that
+        cannot explain a system-level node not yet explained are skipped
+        Returns:
+        CheckResult of every check that ran, in evaluation order. self.explanation is set to a minimal list of
+        violated to_check nodes explaining all the system-level nodes they can explain, if explains is given.
+        """
+        if stop_early and explains is None:
+            raise ValueError('stop_early needs explains')
+        with span('second_stage', nodes=len(to_check)) as sp:
+            sp.track('evaluator', term_evaluators)
+            # one check per distinct term
+            checks = {}
+            for node in to_check:
+                checks.setdefault(self.G.nodes[node]['term'], []).append(node)
+            keys = list(checks)
+            compiled = [term_evaluators.get(self.index.term(key)) for key in keys]
+            missing = [set(self._missing(c)) for c in compiled]
+            waiting = {}
+            for k, names in enumerate(missing):
+                for name in names:
+                    waiting.setdefault(name, []).append(k)
+            # cheapest first, a check is pushed again whenever one of its variables is fetched
+            heap = [(len(names), k) for k, names in enumerate(missing)]
+            heapq.heapify(heap)
+            done = [False] * len(keys)
+
+            uncovered = set().union(*explains.values()) if explains else set()
+            violated = []
+            results = []
+            while heap:
+                if stop_early and not uncovered:
+                    break
+                cost, k = heapq.heappop(heap)
+                if done[k] or cost != len(missing[k]):
+                    continue
+                if stop_early and not any(uncovered & explains.get(node, set()) for node in checks[keys[k]]):
+                    done[k] = True
+                    continue
+                done[k] = True
+                fetched = self._fetch(sorted(missing[k]))
+                for name in list(missing[k]):
+                    # fetched, or unavailable: no other check waits for it
+                    for j in waiting.pop(name, ()):
+                        if not done[j]:
+                            missing[j].discard(name)
+                            heapq.heappush(heap, (len(missing[j]), j))
+                status = self._status(compiled[k])
+                results.append(CheckResult(keys[k], checks[keys[k]], status, fetched))
+                if status == 'violated':
+                    violated += checks[keys[k]]
+                    if explains:
+                        for node in checks[keys[k]]:
+                            uncovered -= explains.get(node, set())
+
+            if explains is not None:
+                self.explanation = _minimal_cover(violated, explains)
+            sp.set(checks=len(keys), evaluated=len(results), violated=len(violated), fetched=len(self.fetched), fetch_calls=self.fetch_calls)
+        return results
+
+
+def _minimal_cover(nodes, explains):
+    # drop the nodes whose system-level nodes are all explained by the other nodes, latest first
+    cover = list(nodes)
+    for node in reversed(nodes):
+        rest = [other for other in cover if other != node]
+        if set().union(*(explains.get(other, set()) for other in rest)) >= explains.get(node, set()):
+            cover = rest
+    return cover
@@ -0,0 +1,357 @@
+"""
+Diagnosis service.
+
+A long-running asyncio server holding a compiled diagnosis artifact (see alice_artifact.py) and diagnosing
+the traces submitted by many clients. Clients connect over a Unix socket or localhost TCP and exchange JSON
+lines:
+
+    {"id": 1, "values": {name: value}, "internal": {name: value}}   ->   {"id": 1, "diagnosis": {...}, "queued": s, "service": s}
+    {"op": "metrics"}                                                ->   {"metrics": {...}}
+
+Submissions go to a bounded queue. When it is full, the server stops reading from the connections, so
+clients block in their writes instead of growing the queue. The guarantee evaluation and reachability lookups
+run in a process pool, and every worker loads the read-only artifact once at startup. Results are written
+back as soon as they are ready, so they may arrive out of submission order and are matched by id.
+generate_load is a local load generator for the service.
+"""
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from alice_artifact import load_artifact
+from alice_instrumentation import span
+from alice_tracevalues import parse_values
+
+# longest request or result line, in bytes
+LINE_LIMIT = 2**24
+
+_artifact = None
+
+
+def _init_worker(path):
+    global _artifact
+    _artifact = load_artifact(path)
+
+
+def _diagnose(values, internal):
+    return _artifact.diagnose(values, internal)._asdict()
+
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class DiagnosisService:
+    """
+    Diagnosis of submitted traces with a compiled artifact.
+    Inputs:
+    artifact: Artifact file written by compile_artifact
+    processes: Number of worker processes (0 diagnoses in the event loop, None for one per CPU)
+    queue_size: Maximum number of queued submissions
+    window: Number of recent completions the recent throughput and the latency percentiles are computed over
+    """
+    def __init__(self, artifact, processes=None, queue_size=64, window=1000):
+        self.path = artifact
+        self.processes = os.cpu_count() if processes is None else processes
+        self.queue_size = queue_size
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._completions = collections.deque(maxlen=window)
+        self._queue = None
+        self._pool = None
+        self._servers = []
+        self._tasks = []
+        self._clients = {}
+        self._started = None
+
+    async def start(self, socket=None, host='127.0.0.1', port=None, metrics_interval=None, report=None):
+        """
+        Load the artifact, start the workers and listen on the Unix socket and/or on host:port.
+        Every metrics_interval seconds, the metrics are emitted in a 'service' span and passed to report.
+        """
+        # fail here rather than in the workers if the artifact is missing or stale
+        load_artifact(self.path)
+        self._queue = asyncio.Queue(self.queue_size)
+        if self.processes:
+            self._pool = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.path,))
+        else:
+            _init_worker(self.path)
+        self._started = time.perf_counter()
+        # one submission in flight per process, a second one waiting in the pool keeps the processes busy
+        for _ in range(2 * self.processes or 1):
+            self._tasks.append(asyncio.create_task(self._work()))
+        if metrics_interval:
+            self._tasks.append(asyncio.create_task(self._report(metrics_interval, report)))
+        if socket is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle, path=socket, limit=LINE_LIMIT))
+        if port is not None:
+            self._servers.append(await asyncio.start_server(self._handle, host, port, limit=LINE_LIMIT))
+        return self
+
+    async def serve_forever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def close(self):
+        """
+        Stop listening, finish the queued submissions, disconnect the clients and stop the workers.
+        """
+        for server in self._servers:
+            server.close()
+        # nothing was queued if start() failed before creating the queue
+        if self._queue is not None:
+            await self._queue.join()
+        # the client handlers stop reading, write their last replies and close their connection
+        for reader, writer in self._clients.values():
+            writer.transport.pause_reading()
+            reader.feed_eof()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def metrics(self):
+        """
+        Counters, queue depth, throughput (diagnoses per second, overall and over the recent completions) and
+        latency percentiles (seconds from submission to result, over the recent completions).
+        """
+        now = time.perf_counter()
+        uptime = now - self._started if self._started else 0
+        recent = None
+        if len(self._completions) > 1 and self._completions[-1] > self._completions[0]:
+            recent = (len(self._completions) - 1) / (self._completions[-1] - self._completions[0])
+        return {
+            'uptime': uptime,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'queue_size': self.queue_size,
+            'throughput': self.completed / uptime if uptime else None,
+            'recent_throughput': recent,
+            'latency_p50': _percentile(self._latencies, 0.5),
+            'latency_p95': _percentile(self._latencies, 0.95),
+            'latency_p99': _percentile(self._latencies, 0.99),
+        }
+
+    async def submit(self, values, internal=None, id=None):
+        """
+        Queue one diagnosis, waiting while the queue is full. Returns a future of the result line.
+        Values are parsed as by the command line (see alice_tracevalues.py), a bad value raises ValueError.
+        """
+        values = parse_values(values)
+        internal = parse_values(internal, 'internal') if internal is not None else None
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(({'id': id, 'values': values, 'internal': internal}, future, time.perf_counter()))
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, future, submitted = await self._queue.get()
+            started = time.perf_counter()
+            self.in_flight += 1
+            try:
+                if self._pool is not None:
+                    diagnosis = await loop.run_in_executor(self._pool, _diagnose, request['values'], request['internal'])
+                else:
+                    diagnosis = _diagnose(request['values'], request['internal'])
+                result = {'id': request['id'], 'diagnosis': diagnosis}
+                self.completed += 1
+            except Exception as e:
+                result = {'id': request['id'], 'error': f'{type(e).__name__}: {e}'}
+                self.failed += 1
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+            done = time.perf_counter()
+            result['queued'] = started - submitted
+            result['service'] = done - started
+            self._latencies.append(done - submitted)
+            self._completions.append(done)
+            if not future.done():
+                future.set_result(result)
+
+    async def _report(self, interval, report):
+        while True:
+            await asyncio.sleep(interval)
+            metrics = self.metrics()
+            with span('service', **metrics):
+                pass
+            if report is not None:
+                report(metrics)
+
+    async def _handle(self, reader, writer):
+        self._clients[asyncio.current_task()] = (reader, writer)
+        replies = set()
+        lock = asyncio.Lock()
+
+        async def reply(result):
+            if isinstance(result, asyncio.Future):
+                result = await result
+            async with lock:
+                writer.write(json.dumps(result).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                line = await _read_line(reader)
+                if not line:
+                    break
+                try:
+                    if line is _TOO_LONG:
+                        raise ValueError(f'line longer than {LINE_LIMIT} bytes')
+                    request = json.loads(line)
+                    if request.get('op') == 'metrics':
+                        result = {'metrics': self.metrics()}
+                    else:
+                        try:
+                            # waits while the queue is full, and this connection is not read meanwhile
+                            result = await self.submit(request.get('values'), request.get('internal'), request.get('id'))
+                        except ValueError as e:
+                            result = {'id': request.get('id'), 'error': f'bad request: {e}'}
+                except (ValueError, AttributeError) as e:
+                    result = {'error': f'bad request: {e}'}
+                task = asyncio.create_task(reply(result))
+                replies.add(task)
+                task.add_done_callback(replies.discard)
+            await asyncio.gather(*replies, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in replies:
+                task.cancel()
+            writer.close()
+            del self._clients[asyncio.current_task()]
+
+
+_TOO_LONG = object()
+
+
+async def _read_line(reader):
+    # one line, b'' at the end of the stream, _TOO_LONG for a line over the limit of reader (which is skipped)
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        try:
+            # the consumed bytes hold no separator
+            await reader.readexactly(consumed)
+            await reader.readuntil(b'\n')
+            return _TOO_LONG
+        except asyncio.IncompleteReadError:
+            return b''
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+async def _connect(socket=None, host='127.0.0.1', port=None):
+    if socket is not None:
+        return await asyncio.open_unix_connection(socket, limit=LINE_LIMIT)
+    return await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+
+
+async def request_metrics(socket=None, host='127.0.0.1', port=None):
+    """
+    Metrics of a running service.
+    """
+    reader, writer = await _connect(socket, host, port)
+    try:
+        writer.write(b'{"op": "metrics"}\n')
+        await writer.drain()
+        return json.loads(await reader.readline())['metrics']
+    finally:
+        writer.close()
+
+
+async def generate_load(values, socket=None, host='127.0.0.1', port=None, requests=1000, connections=8, window=4,
+                        internal=None, flip=0.0, seed=0):
+    """
+    Submit requests diagnoses of values to a running service and measure them.
+    Inputs:
+    values: Observed values {name: value}, internal: Optional internal values
+    requests: Total number of submissions, spread over connections concurrent connections
+    window: Maximum number of unanswered submissions per connection (1 for closed-loop clients)
+    flip: Probability of negating each observed value, to vary the submitted traces
+    Returns:
+    Client-side counts, throughput and latency percentiles, and the service metrics after the run
+    """
+    rng = random.Random(seed)
+    names = list(values)
+    latencies = []
+    errors = 0
+
+    def variant():
+        if not flip:
+            return values
+        return {name: 1 - int(values[name]) if rng.random() < flip else values[name] for name in names}
+
+    async def client(count, offset):
+        reader, writer = await _connect(socket, host, port)
+        slots = asyncio.Semaphore(window)
+        sent = {}
+
+        async def receive():
+            nonlocal errors
+            for _ in range(count):
+                result = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - sent.pop(result['id']))
+                errors += 'error' in result
+                slots.release()
+
+        receiver = asyncio.create_task(receive())
+        try:
+            for k in range(offset, offset + count):
+                await slots.acquire()
+                sent[k] = time.perf_counter()
+                writer.write(json.dumps({'id': k, 'values': variant(), 'internal': internal}).encode() + b'\n')
+                await writer.drain()
+            await receiver
+        finally:
+            receiver.cancel()
+            writer.close()
+
+    start = time.perf_counter()
+    counts = [requests // connections + (k < requests % connections) for k in range(connections)]
+    offsets = [sum(counts[:k]) for k in range(connections)]
+    await asyncio.gather(*(client(count, offset) for count, offset in zip(counts, offsets) if count))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else None,
+        'latency_p50': _percentile(latencies, 0.5),
+        'latency_p95': _percentile(latencies, 0.95),
+        'latency_p99': _percentile(latencies, 0.99),
+        'service': await request_metrics(socket, host, port),
+    }
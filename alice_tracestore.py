@@ -0,0 +1,145 @@
+"""
+Columnar, bit-packed, memory-mapped trace storage.
+
+A trace store file holds K samples of boolean variables. Every variable is one bit-packed row of the data
+block, and the variable names are stored once in a table after the header:
+
+    header   <8sIIQQQQQ: magic, version, reserved, K, number of variables, row stride, names length, data offset
+    names    UTF-8, one name per line
+    data     number of variables x row stride bytes, bit i of a row is sample i (little bit order)
+
+The data block is opened with np.memmap, so a multi-GB recording is not loaded: packed rows are read as
+zero-copy views, and only the requested samples are unpacked.
+"""
+import os
+import struct
+import sys
+import numpy as np
+from system_trace import get_system_trace, get_internal_system_trace
+
+_MAGIC = b'ALICETRC'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIQQQQQ')
+_ALIGN = 64
+
+
+def _align(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_trace_store(path, trace):
+    """
+    Write a columnar trace {name: [v_0, ..., v_K-1]} (the format of system_trace.get_system_trace) to path.
+    """
+    names = list(trace.keys())
+    lengths = {len(values) for values in trace.values()}
+    if len(lengths) > 1:
+        raise ValueError(f'Trace columns have different lengths: {sorted(lengths)}')
+    n = lengths.pop() if lengths else 0
+    stride = _align(-(-n // 8)) if n else 0
+    names_blob = '\n'.join(names).encode()
+    data_offset = _align(_HEADER.size + len(names_blob))
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, 0, n, len(names), stride, len(names_blob), data_offset))
+        f.write(names_blob)
+        f.write(b'\0' * (data_offset - _HEADER.size - len(names_blob)))
+        row = np.zeros(stride, dtype=np.uint8)
+        for name in names:
+            packed = np.packbits(np.asarray(trace[name], dtype=bool), bitorder='little')
+            row[:len(packed)] = packed
+            row[len(packed):] = 0
+            f.write(row.tobytes())
+    os.replace(tmp, path)
+
+
+class TraceStore:
+    """
+    Read-only, memory-mapped view of a trace store file.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f'{path} is not a trace store')
+            magic, version, _, n, n_vars, stride, names_length, data_offset = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f'{path} is not a trace store of version {_VERSION}')
+            names_blob = f.read(names_length).decode()
+        self.n_samples = n
+        self.names = [sys.intern(name) for name in names_blob.split('\n')] if n_vars else []
+        self.index = {name: row for row, name in enumerate(self.names)}
+        self._stride = stride
+        if n_vars and stride:
+            self._data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset, shape=(n_vars, stride))
+        else:
+            self._data = np.zeros((n_vars, 0), dtype=np.uint8)
+
+    def __len__(self):
+        return self.n_samples
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def packed(self, name):
+        """
+        Bit-packed row of name, a zero-copy view of the file.
+        """
+        return self._data[self.index[name]]
+
+    def column(self, name, start=0, stop=None):
+        """
+        Values of name for samples start..stop-1 as a boolean array.
+        """
+        start, stop, _ = slice(start, stop).indices(self.n_samples)
+        if stop <= start:
+            return np.zeros(0, dtype=bool)
+        # unpack only the bytes covering the range
+        first, last = start // 8, -(-stop // 8)
+        bits = np.unpackbits(self._data[self.index[name], first:last], bitorder='little')
+        return bits[start - 8*first:stop - 8*first].view(bool)
+
+    def columns(self, start=0, stop=None, names=None):
+        """
+        Columnar trace {name: boolean array} of samples start..stop-1, for the given names (all by default).
+        """
+        return {name: self.column(name, start, stop) for name in (self.names if names is None else names)}
+
+    def sample(self, i, names=None):
+        """
+        Values {name: 0 or 1} of sample i, for the given names (all by default).
+        """
+        if not 0 <= i < self.n_samples:
+            raise IndexError(f'Sample {i} out of range for {self.n_samples} samples')
+        rows = list(range(len(self.names))) if names is None else [self.index[name] for name in names]
+        bits = (self._data[rows, i >> 3] >> (i & 7)) & 1
+        return dict(zip(self.names if names is None else names, bits.tolist()))
+
+    def to_trace(self, start=0, stop=None):
+        """
+        Convert samples start..stop-1 back to the {name: [v_0, ...]} format of system_trace.
+        """
+        return {name: column.astype(int).tolist() for name, column in self.columns(start, stop).items()}
+
+    def close(self):
+        # the mapping is released once no view of it is left
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def trace_store_from_system_trace(path, internal=False):
+    """
+    Write the Alice example trace (system_trace.get_system_trace, and the internal trace if internal) to path.
+    """
+    trace = get_system_trace()
+    if internal:
+        trace = trace | get_internal_system_trace()
+    write_trace_store(path, trace)
+    return TraceStore(path)
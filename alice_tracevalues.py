@@ -0,0 +1,38 @@
+"""
+Values of trace variables.
+
+Shared by the trace readers of the command line (alice_cli.py), the online monitor (alice_monitor.py) and
+the diagnosis service (alice_service.py), and by the term evaluators in and out of process, so that a trace
+gets the same diagnosis whichever way it is submitted. Only imports the standard library.
+"""
+
+# largest number of unassigned variables a term is checked on by enumerating their values, terms with more
+# unassigned variables are checked by substitution
+MAX_ENUMERATED = 10
+
+_BOOLEANS = {'true': 1, 'false': 0}
+
+
+def parse_value(value, name=None):
+    """
+    Value of a trace variable as an int: ints and bools as is, strings of an integer or of true/false in any case.
+    """
+    if isinstance(value, (bool, int)):
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lower() in _BOOLEANS:
+            return _BOOLEANS[text.lower()]
+        if text.lstrip('-').isdigit():
+            return int(text)
+    raise ValueError(f'{value!r} is not a trace value' + (f' (variable {name})' if name is not None else ''))
+
+
+
+def parse_values(values, name='values'):
+    """
+    Parse every value of a behavior {name: value} with parse_value, name is the behavior in error messages.
+    """
+    if not isinstance(values, dict):
+        raise ValueError(f'{name} must be an object {{name: value}}')
+    return {key: parse_value(value, key) for key, value in values.items()}
@@ -0,0 +1,296 @@
+"""
+Unrolling the Alice system over many timesteps.
+
+The perception, planner and tracker contracts are composed once per kind of timestep (sequenced or final)
+into a template. Other timesteps are obtained by shifting the timestep suffixes of the variables in the
+composed contract and in its diagnostics graph, instead of composing the components again.
+
+Known limitation: only the compositions within a timestep are reused. Chaining the timesteps (compose_spans)
+composes the system of timesteps 1..k-1 with timestep k at every step, and that contract grows with k, so
+the time per timestep grows with the horizon instead of staying flat.
+"""
+import re
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+import networkx as nx
+import sympy
+from pacti.iocontract import Var
+from pacti.terms.propositions.propositions import PropositionalTerm, _expr_to_str
+from alice_contracts import get_perception_contract, get_planner_contract, get_tracker_contract
+from alice_helperfunctions import build_composition_graph, connect_graphs, add_nodes_and_edges, feed_into, TermIndex, term_index
+from alice_cache import compose_diagnostics
+from alice_instrumentation import span, graph_size
+
+Timestep = namedtuple('Timestep', ['timestep', 'sys', 'G'])
+# composition of the timesteps first..last
+Span = namedtuple('Span', ['first', 'last', 'name', 'sys', 'G'])
+
+# contract factories (timestep, width) -> contract of the components of a timestep
+COMPONENTS = {'perception': get_perception_contract, 'planner': get_planner_contract, 'tracker': get_tracker_contract}
+
+# names ending with a timestep: car_l_P_t1, q_1_t0, z5_1, perception_and_planner_2
+_TIMESTEP_SUFFIX = re.compile(r'^(.+)_(t?)(\d+)$')
+
+
+def shift_timestep(name, offset):
+    """
+    Shift the timestep suffix of a variable or contract name by offset; other names are returned as is.
+    """
+    m = _TIMESTEP_SUFFIX.match(name)
+    if m is None or offset == 0:
+        return name
+    return f'{m.group(1)}_{m.group(2)}{int(m.group(3)) + offset}'
+
+
+def shift_symbols(expressions, offset):
+    """
+    Map from the symbols of expressions to their names shifted by offset (see shift_timestep), for the
+    symbols whose name changes; expression.xreplace of it renames a term.
+    """
+    symbols = set()
+    for expression in expressions:
+        symbols |= expression.free_symbols
+    symbol_map = {}
+    for s in symbols:
+        name = shift_timestep(s.name, offset)
+        if name != s.name:
+            symbol_map[s] = sympy.Symbol(name, **s.assumptions0)
+    return symbol_map
+
+
+def mark_dropped_terms(G, contract):
+    # filter out every term that is dropped by the composition
+    for i in G.nodes():
+        if i not in contract.g.terms and i not in contract.a.terms:
+            G.nodes[i]['output'] = False
+
+
+def compose_timestep(timestep, final=False, cache=None, width=100, components=None):
+    """
+    Compose perception, planner and tracker for one timestep.
+    The last timestep (final=True) does not keep the internal q and car_P variables.
+    Compositions are looked up in cache (a CompositionCache) if one is given.
+    width is the number of extra x/y/z variables of the components (see alice_contracts.py).
+    components maps component names to contract factories replacing the ones of COMPONENTS.
+    Returns:
+    sys, perception_and_planner: Composed contracts
+    G2_a, G1_a: Composition graphs of (perception_and_planner, tracker) and (perception, planner)
+    """
+    if final:
+        vars_to_keep = None
+        prefixes = ('c', 'd')
+    else:
+        vars_to_keep = [f'q_1_t{timestep}', f'q_2_t{timestep}', f'q_3_t{timestep}', f'q_4_t{timestep}', f'car_l_P_t{timestep}', f'car_r_P_t{timestep}', f'car_s_P_t{timestep}']
+        prefixes = ('a', 'b')
+
+    factories = COMPONENTS | components if components else COMPONENTS
+    perception = factories['perception'](timestep, width)
+    planner = factories['planner'](timestep, width)
+    perception_and_planner, G1 = compose_diagnostics(perception, planner, vars_to_keep, cache)
+    mark_dropped_terms(G1, perception_and_planner)
+    contractdict = {'self': f'perception_{timestep}', 'other': f'planner_{timestep}', 'composition': f'perception_and_planner_{timestep}'}
+    G1_a = build_composition_graph(G1, prefixes[0], contractdict, system_level=False)
+
+    tracker = factories['tracker'](timestep, width)
+    sys, G2 = compose_diagnostics(perception_and_planner, tracker, vars_to_keep, cache)
+    mark_dropped_terms(G2, sys)
+    contractdict = {'self': f'perception_and_planner_{timestep}', 'other': f'tracker_{timestep}', 'composition': f'system_{timestep}'}
+    G2_a = build_composition_graph(G2, prefixes[1], contractdict, system_level=False)
+
+    return sys, perception_and_planner, G2_a, G1_a
+
+
+class TimestepTemplate:
+    """
+    A timestep composed once and instantiated at any other timestep by renaming.
+    """
+    def __init__(self, timestep, final=False, cache=None, width=100, components=None):
+        self.timestep = timestep
+        self.final = final
+        self.width = width
+        self.sys, self.perception_and_planner, self.G2, self.G1 = compose_timestep(timestep, final, cache, width, components)
+        self.G = connect_graphs(self.G2, self.G1)
+        self._expressions = None
+
+    def _parse_terms(self):
+        # parse the terms of the template graph once, they are renamed for every instance
+        if self._expressions is None:
+            index = term_index(self.G)
+            self._expressions = {term: index.term(term).expression for term in index.nodes}
+        return self._expressions
+
+    def instantiate(self, timestep):
+        """
+        Return the Timestep (system contract and diagnostics graph) of this template at timestep.
+        """
+        offset = timestep - self.timestep
+        if offset == 0:
+            return Timestep(timestep, self.sys, self.G)
+        with span('instantiate', timestep=timestep, **graph_size(self.G)):
+            return self._instantiate(timestep, offset)
+
+    def _instantiate(self, timestep, offset):
+        expressions = self._parse_terms()
+        contract_terms = [term.expression for term in self.sys.a.terms + self.sys.g.terms]
+        symbol_map = shift_symbols(list(expressions.values()) + contract_terms, offset)
+
+        # rename the contract
+        def rename_terms(termlist):
+            return type(termlist)([PropositionalTerm(term.expression.xreplace(symbol_map)) for term in termlist.terms])
+        sys = type(self.sys)(
+            rename_terms(self.sys.a),
+            rename_terms(self.sys.g),
+            [Var(shift_timestep(v.name, offset)) for v in self.sys.inputvars],
+            [Var(shift_timestep(v.name, offset)) for v in self.sys.outputvars])
+
+        # rename the diagnostics graph, node names get the timestep as suffix
+        renamed = {term: PropositionalTerm(expression.xreplace(symbol_map)) for term, expression in expressions.items()}
+        terms = {term: _expr_to_str(parsed.expression) for term, parsed in renamed.items()}
+        G = nx.DiGraph()
+        G.add_nodes_from(
+            (f'{node}_t{timestep}', {**attrs, 'term': terms[attrs['term']], 'contract': shift_timestep(attrs['contract'], offset)})
+            for node, attrs in self.G.nodes(data=True))
+        G.add_edges_from((f'{u}_t{timestep}', f'{v}_t{timestep}', attrs) for u, v, attrs in self.G.edges(data=True))
+        index = G.graph['term_index'] = TermIndex()
+        for node, term in self.G.nodes(data='term'):
+            index.add(f'{node}_t{timestep}', terms[term], renamed[term])
+        return Timestep(timestep, sys, G)
+
+
+def compose_spans(left, right, root, cache=None):
+    """
+    Compose the systems of two adjacent spans of timesteps into a system-level composition graph.
+    """
+    sys, G_c = compose_diagnostics(left.sys, right.sys, cache=cache)
+    if root:
+        name, prefix = 'full_system', 'f'
+    else:
+        mark_dropped_terms(G_c, sys)
+        name, prefix = f'system_{left.first}_to_{right.last}', f'f{left.first}_{right.last}_'
+    contractdict = {'self': left.name, 'other': right.name, 'composition': name}
+    G_c = build_composition_graph(G_c, prefix, contractdict, system_level=True)
+    return Span(left.first, right.last, name, sys, G_c)
+
+
+def _instantiate_all(template, timesteps):
+    return [template.instantiate(k) for k in timesteps]
+
+
+def _chunks(items, n):
+    size = -(-len(items) // n)
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def unroll(horizon, sequenced=None, final=None, cache=None, processes=None, width=100, tree=False):
+    """
+    Compose the Alice system over timesteps 1..horizon.
+    Inputs:
+    horizon: Number of timesteps
+    sequenced: Template for timesteps 1..horizon-1 (composed at timestep 1 if not given)
+    final: Template for the last timestep (composed at timestep horizon if not given)
+    cache: Optional CompositionCache for all compositions
+    processes: If given, the templates and the timesteps are computed in a pool of that many processes. The
+    result is the same as without processes.
+    width: Number of extra x/y/z variables of the components, for the templates composed here
+    tree: With processes, compose the timesteps as a balanced tree instead of a left fold, the system-level
+    compositions of a tree level running in parallel. The intermediate compositions are then different ones
+    (system_3_to_4 instead of system_1_to_3), so G is not the serial graph up to node renaming: only full_sys,
+    the component-level inputs and the inputs reaching every full_system guarantee are the same.
+    Returns:
+    full_sys: System contract over all timesteps
+    G: Diagnostics graph of full_sys
+    timesteps: Timestep (timestep, sys, G) for every timestep
+    """
+    with span('unroll', horizon=horizon, width=width, processes=processes, tree=tree) as sp:
+        if processes:
+            full_sys, G, timesteps = _unroll_parallel(horizon, sequenced, final, cache, processes, width, tree)
+        else:
+            full_sys, G, timesteps = _unroll(horizon, sequenced, final, cache, width)
+        sp.set(guarantees=len(full_sys.g.terms), **graph_size(G))
+    return full_sys, G, timesteps
+
+
+def _unroll(horizon, sequenced, final, cache, width):
+    if horizon > 1 and sequenced is None:
+        sequenced = TimestepTemplate(1, cache=cache, width=width)
+    if final is None:
+        final = TimestepTemplate(horizon, final=True, cache=cache, width=width)
+    timesteps = [sequenced.instantiate(k) for k in range(1, horizon)] + [final.instantiate(horizon)]
+    full_sys, G = _chain(timesteps, horizon, cache)
+    return full_sys, G, timesteps
+
+
+def _chain(timesteps, horizon, cache):
+    # chain the timesteps: system_1 o system_2 o ... o system_horizon
+    spans = [Span(step.timestep, step.timestep, f'system_{step.timestep}', step.sys, step.G) for step in timesteps]
+    G = nx.DiGraph()
+    add_nodes_and_edges(G, spans[0].G)
+    acc = spans[0]
+    for step in spans[1:]:
+        layer = compose_spans(acc, step, step.last == horizon, cache)
+        # same as connect_graphs(layer.G, acc.G, step.G), without copying the graph built so far
+        with span('connect_graphs', composition=layer.name) as sp:
+            add_nodes_and_edges(G, layer.G)
+            feed_into(G, acc.G, layer.G)
+            add_nodes_and_edges(G, step.G)
+            feed_into(G, step.G, layer.G)
+            sp.set(**graph_size(G))
+        acc = layer
+    return acc.sys, G
+
+
+def _unroll_parallel(horizon, sequenced, final, cache, processes, width, tree):
+    with ProcessPoolExecutor(processes) as pool:
+        # the two templates are independent
+        if horizon > 1 and sequenced is None:
+            sequenced = pool.submit(TimestepTemplate, 1, False, cache, width)
+        if final is None:
+            final = pool.submit(TimestepTemplate, horizon, True, cache, width)
+        if isinstance(sequenced, Future):
+            sequenced = sequenced.result()
+        if isinstance(final, Future):
+            final = final.result()
+
+        # instantiate the timesteps in chunks, so every worker receives the template once
+        futures = []
+        if horizon > 1:
+            futures = [pool.submit(_instantiate_all, sequenced, ks) for ks in _chunks(list(range(1, horizon)), processes)]
+        timesteps = [step for f in futures for step in f.result()] + [final.instantiate(horizon)]
+        if tree:
+            full_sys, G = _reduce_tree(pool, timesteps, cache)
+
+    if not tree:
+        # every layer composes the previous one, the chain is serial
+        full_sys, G = _chain(timesteps, horizon, cache)
+    return full_sys, G, timesteps
+
+
+def _reduce_tree(pool, timesteps, cache):
+    # balanced tree reduction, one level at a time, the compositions of a level run in parallel
+    spans = [Span(step.timestep, step.timestep, f'system_{step.timestep}', step.sys, step.G) for step in timesteps]
+    layers = []
+    level = spans
+    while len(level) > 1:
+        pairs = [(level[i], level[i+1]) for i in range(0, len(level) - 1, 2)]
+        root = len(level) == 2
+        # only the contracts are sent to the workers
+        futures = [pool.submit(compose_spans, left._replace(G=None), right._replace(G=None), root, cache) for left, right in pairs]
+        new_level = []
+        for (left, right), f in zip(pairs, futures):
+            layer = f.result()
+            layers.append((layer, left, right))
+            new_level.append(layer)
+        if len(level) % 2:
+            new_level.append(level[-1])
+        level = new_level
+
+    with span('connect_graphs', composition='full_system') as sp:
+        G = nx.DiGraph()
+        for step in spans:
+            add_nodes_and_edges(G, step.G)
+        for layer, left, right in layers:
+            add_nodes_and_edges(G, layer.G)
+            feed_into(G, left.G, layer.G)
+            feed_into(G, right.G, layer.G)
+        sp.set(**graph_size(G))
+    return level[0].sys, G
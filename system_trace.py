@@ -1,8 +1,11 @@
 """
 The observed system trace for the Alice example.
+
+width is the number of extra z outputs of the tracker and horizon the number of timesteps, as in
+alice_contracts.py. Timesteps after the second repeat the observations of the second one.
 """
 
-def get_system_trace():
+def get_system_trace(width=100, horizon=2):
     timestep = 1
     trace = {}
 
@@ -21,41 +24,41 @@ def get_system_trace():
     trace[f'q_4_t{timestep-1}'] = [1]
 
     # true car observations
-    trace[f'car_l_T_t{timestep}'] = [1]
-    trace[f'car_r_T_t{timestep}'] = [1] 
-    trace[f'car_s_T_t{timestep}'] = [1]
-    trace[f'car_l_T_t{timestep+1}'] = [1]
-    trace[f'car_r_T_t{timestep+1}'] = [1] 
-    trace[f'car_s_T_t{timestep+1}'] = [1]
+    for k in range(timestep, timestep+horizon):
+        trace[f'car_l_T_t{k}'] = [1]
+        trace[f'car_r_T_t{k}'] = [1]
+        trace[f'car_s_T_t{k}'] = [1]
 
     # outputs (observable)
     # Alice's speed
     trace[f'v_t{timestep}'] = [0]
-    trace[f'v_t{timestep+1}'] = [1]
+    for k in range(timestep+1, timestep+horizon):
+        trace[f'v_t{k}'] = [1]
     # extra tracker output vars
-    for i in range(0, 100):
-        trace[f'z{i}_1'] = [1]
-        trace[f'z{i}_2'] = [1]
+    for i in range(0, width):
+        for k in range(timestep, timestep+horizon):
+            trace[f'z{i}_{k}'] = [1]
 
     return trace
 
-def get_internal_system_trace():
+def get_internal_system_trace(horizon=2):
     timestep = 1
     trace = {}
     # internal variables
     trace[f'car_l_P_t{timestep}'] = [0]
     trace[f'car_r_P_t{timestep}'] = [0]
     trace[f'car_s_P_t{timestep}'] = [0]
-    trace[f'car_l_P_t{timestep+1}'] = [1]
-    trace[f'car_r_P_t{timestep+1}'] = [1]
-    trace[f'car_s_P_t{timestep+1}'] = [1]
     trace[f'q_1_t{timestep}'] = [0]
     trace[f'q_2_t{timestep}'] = [0]
     trace[f'q_3_t{timestep}'] = [0]
     trace[f'q_4_t{timestep}'] = [1]
-    trace[f'q_1_t{timestep+1}'] = [1]
-    trace[f'q_2_t{timestep+1}'] = [0]
-    trace[f'q_3_t{timestep+1}'] = [0]
-    trace[f'q_4_t{timestep+1}'] = [0]
+    for k in range(timestep+1, timestep+horizon):
+        trace[f'car_l_P_t{k}'] = [1]
+        trace[f'car_r_P_t{k}'] = [1]
+        trace[f'car_s_P_t{k}'] = [1]
+        trace[f'q_1_t{k}'] = [1]
+        trace[f'q_2_t{k}'] = [0]
+        trace[f'q_3_t{k}'] = [0]
+        trace[f'q_4_t{k}'] = [0]
 
     return trace
@@ -0,0 +1,94 @@
+"""
+Diagnosis with a precompiled artifact against the in-process diagnosis of the composed system.
+"""
+import random
+
+import pytest
+import sympy
+from pacti.terms.propositions.propositions import _expr_to_str
+
+from alice_artifact import Artifact, _Term, artifact_data, load_artifact, write_artifact
+from alice_helperfunctions import CompiledTerm, ReachabilityIndex, evaluate_term, term_evaluators, term_index
+from alice_unrolling import unroll
+from system_trace import get_internal_system_trace, get_system_trace
+
+WIDTH = 2
+
+
+@pytest.fixture(scope='module', params=[1, 2, 3])
+def system(request):
+    horizon = request.param
+    full_sys, G, _ = unroll(horizon, width=WIDTH)
+    return horizon, full_sys, G, Artifact(artifact_data(full_sys, G, horizon, WIDTH))
+
+
+def traces(horizon, rng, n=20):
+    # the example trace, and variants with flipped and unassigned values
+    values = {name: column[0] for name, column in get_system_trace(WIDTH, horizon).items()}
+    internal = {name: column[0] for name, column in get_internal_system_trace(horizon).items()}
+    yield values, internal
+    for _ in range(n):
+        variant = {name: 1 - value if rng.random() < 0.2 else value for name, value in values.items() if rng.random() < 0.9}
+        yield variant, {name: value for name, value in internal.items() if rng.random() < 0.7}
+
+
+def status(term, values):
+    # as SecondStage: violated if the term fails for all values of the unassigned variables
+    compiled = term_evaluators.get(term)
+    if compiled(values):
+        return 'satisfied'
+    if all(name in values for name in compiled.support) or CompiledTerm(~compiled.expression)(values):
+        return 'violated'
+    return 'unknown'
+
+
+def reference_diagnosis(horizon, full_sys, G, values, internal):
+    index = term_index(G)
+    top = 'full_system' if horizon > 1 else f'system_{horizon}'
+    sinks = {node for node, attrs in G.nodes(data=True) if attrs['contract'] == top and attrs['type'] == 'guarantee' and attrs['output'] == 'True'}
+    component_contracts = {f'{component}_{k}' for k in range(1, horizon+1) for component in ['perception', 'planner', 'tracker']}
+    sources = [node for node, attrs in G.nodes(data=True) if attrs['input'] == 'True' and attrs['contract'] in component_contracts]
+
+    assumptions = [term_evaluators.key(term) for term in full_sys.a.terms if not evaluate_term(term, values)]
+    violated = []
+    for i, term in enumerate(full_sys.g.terms):
+        if not evaluate_term(term, values):
+            key = term_evaluators.key(term)
+            violated.append((i, key, next((node for node in index.nodes_of(key) if node in sinks), None)))
+    to_check = ReachabilityIndex(G, sources).relevant_sources([node for _, _, node in violated if node is not None])
+    behavior = values | internal
+    components = [(node, G.nodes[node]['term'], G.nodes[node]['contract'], status(index.term(G.nodes[node]['term']), behavior)) for node in to_check]
+    return assumptions, violated, to_check, components
+
+
+def test_diagnose_matches_in_process(system):
+    horizon, full_sys, G, artifact = system
+    rng = random.Random(horizon)
+    for values, internal in traces(horizon, rng):
+        assumptions, violated, to_check, components = reference_diagnosis(horizon, full_sys, G, values, internal)
+        diagnosis = artifact.diagnose(values, internal)
+        assert diagnosis.assumptions == assumptions
+        assert diagnosis.violated == violated
+        assert [node for node, _, _ in diagnosis.to_check] == to_check
+        assert diagnosis.components == components
+
+
+def test_artifact_round_trip(system, tmp_path):
+    horizon, full_sys, G, artifact = system
+    path = tmp_path / 'alice.artifact'
+    write_artifact(path, artifact.data)
+    loaded = load_artifact(path)
+    values = {name: column[0] for name, column in get_system_trace(WIDTH, horizon).items()}
+    assert loaded.diagnose(values) == artifact.diagnose(values)
+    assert set(loaded.graph().edges) == set(G.edges)
+
+
+def test_term_with_many_unassigned_variables():
+    # more unassigned variables than are enumerated: checked by substitution, like CompiledTerm
+    symbols = sympy.symbols(f'a0:{_Term.max_enumerated + 2}')
+    for expression, expected in [(sympy.Implies(sympy.And(*symbols), symbols[0]), ('satisfied', 'satisfied')),
+                                 (sympy.Or(*symbols), ('unknown', 'unknown')),
+                                 (sympy.And(symbols[0], sympy.Or(*symbols[1:])), ('violated', 'unknown'))]:
+        compiled = CompiledTerm(expression)
+        term = _Term(_expr_to_str(expression), compiled.support, compiled.source)
+        assert (term.status({'a0': 0}), term.status({})) == expected
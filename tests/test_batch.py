@@ -0,0 +1,84 @@
+"""
+Batch diagnosis of a handwritten system against diagnosing every sample on its own with evaluate_term.
+"""
+import random
+
+import networkx as nx
+import pytest
+from pacti.contracts import PropositionalIoContract
+
+from alice_batch import diagnose_batch, group_by_signature
+from alice_helperfunctions import evaluate_term, term_evaluators
+
+FULL_SYS = PropositionalIoContract.from_strings(input_vars=['a', 'c', 'e'], output_vars=['b', 'd'], assumptions=[],
+                                                guarantees=['a <=> b', 'c | d', 'e'])
+SOURCES = ['s0', 's1', 's2']
+INPUTS = ['a', 'b', 'c', 'd', 'e']
+INTERNAL = ['x', 'y']
+
+
+def diagnostics_graph():
+    G = nx.DiGraph()
+    attrs = {'type': 'guarantee', 'input': 'False', 'output': 'False', 'system_level': 'False'}
+    equivalence, disjunction, e = (term_evaluators.key(term) for term in FULL_SYS.g.terms)
+    G.add_node('s0', **{**attrs, 'term': 'a', 'contract': 'perception_1', 'input': 'True'})
+    G.add_node('s1', **{**attrs, 'term': term_evaluators.key('x & y'), 'contract': 'planner_1', 'input': 'True'})
+    G.add_node('s2', **{**attrs, 'term': 'd', 'contract': 'tracker_1', 'input': 'True'})
+    # a system-level output node of an intermediate composition, not the top one
+    G.add_node('x0', **{**attrs, 'term': e, 'contract': 'system_1', 'output': 'True', 'system_level': 'True'})
+    for node, term in [('f0', equivalence), ('f1', disjunction), ('f2', e)]:
+        G.add_node(node, **{**attrs, 'term': term, 'contract': 'full_system', 'output': 'True', 'system_level': 'True'})
+    G.add_edges_from([('s0', 'f0'), ('s1', 'f0'), ('s1', 'f1'), ('s2', 'f1'), ('s2', 'x0')])
+    return G
+
+
+def random_trace(rng, names, n):
+    return {name: [rng.randint(0, 1) for _ in range(n)] for name in names}
+
+
+def sample(trace, i):
+    return {name: column[i] for name, column in trace.items()}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_per_sample(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 60)
+    trace, internal = random_trace(rng, INPUTS, n), random_trace(rng, INTERNAL, n)
+    G = diagnostics_graph()
+    matrix, diagnoses = diagnose_batch(FULL_SYS, G, trace, SOURCES, internal_trace=internal)
+
+    nodes = ['f0', 'f1', 'f2']
+    expected = {}
+    for i in range(n):
+        values = sample(trace, i)
+        violated = tuple(j for j, term in enumerate(FULL_SYS.g.terms) if not evaluate_term(term, values))
+        assert matrix[i].tolist() == [j in violated for j in range(len(FULL_SYS.g.terms))]
+        expected.setdefault(violated, []).append(i)
+
+    # one diagnosis for every signature with a violated guarantee, each sample in exactly one
+    assert {d.violated: d.samples.tolist() for d in diagnoses} == {violated: samples for violated, samples in expected.items() if violated}
+    for d in diagnoses:
+        assert d.violated_nodes == [nodes[j] for j in d.violated]
+        to_check = []
+        for sink in d.violated_nodes:
+            to_check += [src for src in SOURCES if src not in to_check and nx.has_path(G, src, sink)]
+        assert d.to_check == to_check
+        assert d.component_violations.shape == (len(d.samples), len(to_check))
+        for row, i in enumerate(d.samples):
+            values = sample(trace, i) | sample(internal, i)
+            assert d.component_violations[row].tolist() == [not evaluate_term(G.nodes[src]['term'], values) for src in to_check]
+
+
+def test_empty_and_satisfied():
+    G = diagnostics_graph()
+    matrix, diagnoses = diagnose_batch(FULL_SYS, G, {name: [] for name in INPUTS}, SOURCES)
+    assert matrix.shape == (0, 3) and diagnoses == []
+    assert group_by_signature(matrix) == []
+    matrix, diagnoses = diagnose_batch(FULL_SYS, G, {'a': [1, 0], 'b': [1, 0], 'c': [1, 1], 'd': [0, 0], 'e': [1, 1]}, SOURCES)
+    assert not matrix.any() and diagnoses == []
+
+
+def test_columns_of_different_lengths():
+    with pytest.raises(ValueError, match='different lengths'):
+        diagnose_batch(FULL_SYS, diagnostics_graph(), {'a': [1, 0], 'b': [1]}, SOURCES)
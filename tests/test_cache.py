@@ -0,0 +1,74 @@
+"""
+On-disk composition cache: hits and misses, unreadable entries and eviction of the least recently used entries.
+"""
+import os
+import zlib
+
+import pytest
+
+from alice_cache import _MAGIC, CompositionCache, canonical_contract, composition_key
+from alice_contracts import get_perception_contract, get_planner_contract
+
+WIDTH = 2
+
+
+@pytest.fixture(scope='module')
+def contracts():
+    return get_perception_contract(1, WIDTH), get_planner_contract(1, WIDTH)
+
+
+def test_hit_and_miss(tmp_path, contracts):
+    perception, planner = contracts
+    cache = CompositionCache(str(tmp_path))
+    composed, G = cache.compose_diagnostics(perception, planner)
+    assert (cache.hits, cache.misses) == (0, 1)
+    cached, H = cache.compose_diagnostics(perception, planner)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert canonical_contract(cached) == canonical_contract(composed)
+    assert dict(H.nodes(data=True)) == dict(G.nodes(data=True)) and set(H.edges) == set(G.edges)
+    # another cache on the same directory finds the entry
+    other = CompositionCache(str(tmp_path))
+    other.compose_diagnostics(perception, planner)
+    assert (other.hits, other.misses) == (1, 0)
+    # keeping variables is another composition
+    assert composition_key(perception, planner) != composition_key(perception, planner, ['poor_visibility'])
+
+
+@pytest.mark.parametrize('data', [
+    b'not a cache entry',
+    _MAGIC[:-1] + bytes([_MAGIC[-1] + 1]) + zlib.compress(b'.'),
+    _MAGIC + zlib.compress(b'truncated')[:-4],
+    # pickles of a class in a removed module and of a removed class
+    _MAGIC + zlib.compress(b'calice_removed_module\nGone\n)\x81.'),
+    _MAGIC + zlib.compress(b'cos\nGone\n)\x81.'),
+], ids=['magic', 'version', 'truncated', 'module', 'class'])
+def test_unreadable_entry(tmp_path, contracts, data):
+    perception, planner = contracts
+    cache = CompositionCache(str(tmp_path))
+    path = cache._path(composition_key(perception, planner))
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert cache.get(composition_key(perception, planner)) is None
+    assert not os.path.exists(path) and cache.misses == 1
+    # compose_diagnostics recomposes and stores a readable entry again
+    composed, _ = cache.compose_diagnostics(perception, planner)
+    assert canonical_contract(composed) == canonical_contract(perception.compose_diagnostics(planner)[0])
+    assert cache.get(composition_key(perception, planner)) is not None
+
+
+def test_eviction(tmp_path):
+    cache = CompositionCache(str(tmp_path), max_bytes=1 << 30)
+    for i in range(4):
+        cache.put(f'k{i}', bytes(range(256)) * 8 * (i + 1))
+        os.utime(cache._path(f'k{i}'), (i, i))
+    sizes = {f'k{i}': os.path.getsize(cache._path(f'k{i}')) for i in range(4)}
+    # k0 is used after the others, so k1 is the least recently used entry
+    assert cache.get('k0') is not None
+    cache.max_bytes = sum(sizes.values()) - 1
+    cache.evict()
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.bin')) == ['k0.bin', 'k2.bin', 'k3.bin']
+    # a new entry evicts the least recently used ones until the total fits
+    cache.max_bytes = sizes['k0'] + sizes['k3'] + sizes['k1']
+    cache.put('k1', bytes(range(256)) * 16)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.bin')) == ['k0.bin', 'k1.bin', 'k3.bin']
+    assert cache.get('k2') is None and cache.get('k3') == bytes(range(256)) * 32
@@ -0,0 +1,58 @@
+"""
+Trace input of the command line: every trace format gives the same behavior.
+"""
+import json
+
+import pytest
+
+from alice_cli import read_values
+from alice_tracestore import write_trace_store
+
+VALUES = {'poor_visibility': 0, 'car_l_T_t1': 1, 'v_t1': 0, 'v_t2': 1, 'z0_1': 1}
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_json(tmp_path):
+    assert read_values(write(tmp_path / 'trace.json', json.dumps(VALUES))) == VALUES
+    # booleans and integer strings are values too
+    trace = {name: [bool(value), str(value)][i % 2] for i, (name, value) in enumerate(VALUES.items())}
+    assert read_values(write(tmp_path / 'mixed.json', json.dumps(trace))) == VALUES
+
+
+def test_columnar_json(tmp_path):
+    trace = {name: [value, 1 - value, value] for name, value in VALUES.items()}
+    path = write(tmp_path / 'trace.json', json.dumps(trace))
+    assert read_values(path) == VALUES
+    assert read_values(path, sample=1) == {name: 1 - value for name, value in VALUES.items()}
+
+
+def test_jsonl(tmp_path):
+    # records are merged, timestep entries and unassigned values are skipped
+    lines = [{'timestep': 1, 'poor_visibility': 0, 'car_l_T_t1': 1, 'v_t1': 0, 'v_t2': None},
+             {'timestep': 2, 'v_t2': 1, 'z0_1': True}]
+    path = write(tmp_path / 'trace.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\n\n')
+    assert read_values(path) == VALUES
+
+
+def test_csv(tmp_path):
+    text = 'timestep,poor_visibility,car_l_T_t1,v_t1,v_t2,z0_1\n1,false,1,FALSE,,True\n2,,,,true,\n'
+    assert read_values(write(tmp_path / 'trace.csv', text)) == VALUES
+
+
+def test_trace_store(tmp_path):
+    trace = {name: [value, 1 - value] for name, value in VALUES.items()}
+    path = str(tmp_path / 'trace.trc')
+    write_trace_store(path, trace)
+    assert read_values(path) == VALUES
+    assert read_values(path, sample=1) == {name: 1 - value for name, value in VALUES.items()}
+
+
+@pytest.mark.parametrize('value', ['yes', '1.5', 2.0, None])
+def test_bad_value(tmp_path, value):
+    path = write(tmp_path / 'trace.json', json.dumps({'v_t1': [value] if value is None else value}))
+    with pytest.raises(ValueError, match='v_t1'):
+        read_values(path)
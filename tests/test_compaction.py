@@ -0,0 +1,44 @@
+"""
+Root-cause search on the compacted diagnostics graph against nx.has_path on the full graph.
+"""
+import random
+
+import networkx as nx
+import pytest
+
+from alice_compaction import compact_graph
+from alice_helperfunctions import ReachabilityIndex
+
+
+def random_graph(rng, n=60):
+    # a DAG with a few cycles, and chains of nodes with one predecessor and one successor
+    G = nx.DiGraph()
+    G.add_nodes_from(range(n))
+    for _ in range(int(1.3 * n)):
+        u, v = sorted(rng.sample(range(n), 2))
+        G.add_edge(u, v)
+    for _ in range(3):
+        u, v = sorted(rng.sample(range(n), 2))
+        G.add_edge(v, u)
+    G = nx.relabel_nodes(G, {i: f'n{i}' for i in range(n)})
+    for k in range(5):
+        u, v = sorted(rng.sample(range(n), 2))
+        nx.add_path(G, [f'n{u}'] + [f'c{k}_{i}' for i in range(4)] + [f'n{v}'])
+    return G
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_compacted_reachability_matches_has_path(seed):
+    rng = random.Random(seed)
+    G = random_graph(rng)
+    nodes = list(G)
+    sources = rng.sample(nodes[:30], 10)
+    sinks = rng.sample(nodes[30:], 8)
+    H, members = compact_graph(G, sinks, sources)
+    reachability = ReachabilityIndex(H, sources)
+    for sink in sinks:
+        expected = [src for src in sources if nx.has_path(G, src, sink)]
+        assert sorted(reachability.sources_of(sink)) == sorted(expected), sink
+    # every node of H stands for nodes of G, the kept sources and sinks for themselves
+    assert all(set(members[node]) <= set(G) for node in H)
+    assert all(members[node] == [node] for node in H if node in sources or node in sinks)
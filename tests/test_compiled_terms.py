@@ -0,0 +1,64 @@
+"""
+Compiled term evaluation against the substitution-based reference check_guarantee_subst.
+"""
+import itertools
+import random
+
+import numpy as np
+import pytest
+import sympy
+from sympy.logic import boolalg
+from pacti.iocontract import Var
+from pacti.terms.propositions.propositions import PropositionalTerm
+
+from alice_contracts import get_perception_contract, get_planner_contract, get_tracker_contract
+from alice_helperfunctions import CompiledTerm, check_guarantee, check_guarantee_subst
+
+SYMBOLS = sympy.symbols('a b c d')
+_OPS = [boolalg.And, boolalg.Or, boolalg.Implies, boolalg.Equivalent, boolalg.Xor, boolalg.Nand, boolalg.Nor]
+
+
+def random_expression(rng, depth=3):
+    if depth == 0 or rng.random() < 0.2:
+        symbol = rng.choice(SYMBOLS)
+        return ~symbol if rng.random() < 0.3 else symbol
+    op = rng.choice(_OPS)
+    return op(random_expression(rng, depth - 1), random_expression(rng, depth - 1))
+
+
+def assignments(names, partial=False):
+    # full assignments, and with partial=True also those leaving some variables unassigned
+    for values in itertools.product((0, 1, None) if partial else (0, 1), repeat=len(names)):
+        yield {name: value for name, value in zip(names, values) if value is not None}
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_truth_table_matches_substitution(seed):
+    expression = random_expression(random.Random(seed))
+    term = PropositionalTerm(expression)
+    compiled = CompiledTerm(term.expression)
+    for values in assignments([s.name for s in SYMBOLS], partial=True):
+        behavior = {Var(name): value for name, value in values.items()}
+        assert compiled(values) == check_guarantee_subst(term, behavior), (expression, values)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_batch_matches_scalar(seed):
+    rng = random.Random(seed)
+    compiled = CompiledTerm(random_expression(rng))
+    names = [s.name for s in SYMBOLS]
+    n = 64
+    columns = {name: np.array([rng.random() < 0.5 for _ in range(n)]) for name in names[:3]}
+    expected = [compiled({name: int(column[i]) for name, column in columns.items()}) for i in range(n)]
+    assert compiled.batch(columns, n).tolist() == expected
+
+
+def test_contract_terms_match_substitution():
+    rng = random.Random(0)
+    contracts = [get_perception_contract(2, 2), get_planner_contract(2, 2), get_tracker_contract(2, 2)]
+    terms = [term for contract in contracts for term in contract.a.terms + contract.g.terms]
+    names = sorted({s.name for term in terms for s in term.expression.free_symbols})
+    for _ in range(20):
+        behavior = {Var(name): rng.randint(0, 1) for name in names}
+        for term in terms:
+            assert check_guarantee(term, behavior) == check_guarantee_subst(term, behavior), term
@@ -0,0 +1,121 @@
+"""
+Diagnostics graph construction against pure-networkx versions of the original pairwise implementations.
+"""
+import random
+
+import networkx as nx
+import pytest
+
+from alice_helperfunctions import build_composition_graph, connect_graphs
+
+TERMS = ['a', 'b', 'a & b', 'a | c', 'Implies(b, c)']
+CONTRACTS = ['perception_1', 'planner_1', 'perception_and_planner_1']
+
+
+def random_region(rng, prefix, n=12):
+    G = nx.DiGraph()
+    for i in range(n):
+        G.add_node(f'{prefix}{i}', term=rng.choice(TERMS), type=rng.choice(['assumption', 'guarantee']),
+                   input=str(rng.random() < 0.5), output=str(rng.random() < 0.5), contract=rng.choice(CONTRACTS),
+                   system_level='False')
+    nodes = list(G)
+    for _ in range(n):
+        u, v = rng.sample(nodes, 2)
+        G.add_edge(u, v)
+    return G
+
+
+def reference_connect_graphs(CompG, inG1, inG2=None):
+    # every output node of a child against every input node of CompG
+    G = nx.DiGraph()
+
+    def feed_into(ingraph, outgraph):
+        outputs = [u for u in ingraph if ingraph.nodes[u]['output'] == 'True']
+        inputs = [v for v in outgraph if outgraph.nodes[v]['input'] == 'True']
+        for u in outputs:
+            for v in inputs:
+                if ingraph.nodes[u]['term'] == outgraph.nodes[v]['term'] and ingraph.nodes[u]['contract'] == outgraph.nodes[v]['contract']:
+                    G.add_edge(u, v)
+                    G.nodes[u]['output'] = 'False'
+                    G.nodes[v]['input'] = 'False'
+
+    for graph in [inG1, CompG]:
+        G.add_nodes_from(graph.nodes(data=True))
+        G.add_edges_from(graph.edges(data=True))
+    feed_into(inG1, CompG)
+    if inG2 is not None:
+        G.add_nodes_from(inG2.nodes(data=True))
+        G.add_edges_from(inG2.edges(data=True))
+        feed_into(inG2, CompG)
+    return G
+
+
+def assert_same_graph(G, H):
+    assert set(G.nodes) == set(H.nodes)
+    for node in G:
+        assert dict(G.nodes[node]) == dict(H.nodes[node]), node
+    assert set(G.edges) == set(H.edges)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_connect_graphs_matches_pairwise_join(seed):
+    rng = random.Random(seed)
+    CompG, inG1, inG2 = random_region(rng, 'c'), random_region(rng, 'a'), random_region(rng, 'b')
+    assert_same_graph(connect_graphs(CompG, inG1, inG2), reference_connect_graphs(CompG, inG1, inG2))
+    assert_same_graph(connect_graphs(CompG, inG1), reference_connect_graphs(CompG, inG1))
+
+
+def random_composition(rng, n=12):
+    # graph of compose_diagnostics: nodes are terms, with boolean input/output attributes
+    G = nx.DiGraph()
+    for i in range(n):
+        G.add_node(f'x{i} & y{i % 3}', input=rng.random() < 0.5, output=rng.random() < 0.5,
+                   type=rng.choice(['assumption', 'guarantee']), component=rng.choice(['self', 'other']))
+    nodes = list(G)
+    for _ in range(2 * n):
+        u, v = rng.sample(nodes, 2)
+        G.add_edge(u, v)
+    return G
+
+
+def reference_build_composition_graph(G, prefix, contractdict, system_level=False):
+    # separate input and output nodes of every term, attributes compared as strings
+    attrs = {node: {key: str(value) for key, value in G.nodes[node].items()} for node in G}
+    inputs = {node for node in G if attrs[node]['input'] == 'True'}
+    outputs = {node for node in G if attrs[node]['output'] == 'True'}
+    internal = {node for node in G if attrs[node]['input'] == 'False' and attrs[node]['output'] == 'False'}
+    G_mod = nx.DiGraph()
+    new_inputs, new_outputs, new_internal = {}, {}, {}
+    for i, node in enumerate(G):
+        kind = attrs[node]['type']
+        if node in inputs:
+            new_inputs[node] = prefix + str(i) + 'i'
+            G_mod.add_node(new_inputs[node], term=node, type=kind, input='True', output='False',
+                           contract=contractdict[attrs[node]['component']], system_level=system_level)
+        if node in outputs:
+            new_outputs[node] = prefix + str(i) + 'o'
+            G_mod.add_node(new_outputs[node], term=node, type=kind, input='False', output='True',
+                           contract=contractdict['composition'], system_level=system_level)
+        if node in inputs and node in outputs:
+            G_mod.add_edge(new_inputs[node], new_outputs[node])
+        if node in internal:
+            new_internal[node] = prefix + str(i)
+            G_mod.add_node(new_internal[node], term=node, type=kind, input='False', output='False',
+                           contract='internal', system_level=system_level)
+    for u, v in G.edges():
+        source = new_inputs.get(u, new_internal.get(u))
+        target = new_outputs.get(v, new_internal.get(v))
+        if source is not None and target is not None:
+            G_mod.add_edge(source, target)
+    return G_mod
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_build_composition_graph_matches_reference(seed):
+    G = random_composition(random.Random(seed))
+    contractdict = {'self': 'perception_1', 'other': 'planner_1', 'composition': 'perception_and_planner_1'}
+    expected = reference_build_composition_graph(G, 'a', contractdict)
+    assert_same_graph(build_composition_graph(G, 'a', contractdict), expected)
+    # every node is indexed under its term
+    index = build_composition_graph(G, 'a', contractdict).graph['term_index']
+    assert sorted(node for nodes in index.nodes.values() for node in nodes) == sorted(expected)
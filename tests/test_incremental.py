@@ -0,0 +1,83 @@
+"""
+Incremental recomposition against a fresh unroll with the same components.
+"""
+import pytest
+from pacti.contracts import PropositionalIoContract
+
+from alice_cache import canonical_contract
+from alice_contracts import get_planner_contract, get_tracker_contract, guarantee_generator
+from alice_incremental import IncrementalSystem
+from alice_unrolling import COMPONENTS, TimestepTemplate, unroll
+
+WIDTH = 2
+
+
+def weaker_tracker(timestep, width=100):
+    # the last y <=> z guarantee is relaxed to y | z
+    tracker = get_tracker_contract(timestep, width)
+    return PropositionalIoContract.from_strings(
+        input_vars=[v.name for v in tracker.inputvars],
+        output_vars=[v.name for v in tracker.outputvars],
+        assumptions=['~icy_roads'],
+        guarantees=[f'q_1_t{timestep} <=> v_t{timestep}'] + [f'y{i} <=> z{i}_{timestep}' for i in range(width - 1)] + [f'y{width-1} | z{width-1}_{timestep}'])
+
+
+def weaker_planner(timestep, width=100):
+    # without the x <=> y guarantees
+    planner = get_planner_contract(timestep, width)
+    one_hot = ' | '.join('(' + ' & '.join(('' if q == p else '~') + f'q_{q}_t{timestep-1}' for q in range(1, 5)) + ')' for p in range(1, 5))
+    return PropositionalIoContract.from_strings(
+        input_vars=[v.name for v in planner.inputvars],
+        output_vars=[v.name for v in planner.outputvars],
+        assumptions=[one_hot],
+        guarantees=guarantee_generator(['car_l_P', 'car_r_P', 'car_s_P'], timestep, width)[:-width])
+
+
+def fresh_unroll(system):
+    sequenced = None
+    if system.horizon > 1:
+        sequenced = TimestepTemplate(1, width=system.width, components=system.components[False])
+    final = TimestepTemplate(system.horizon, final=True, width=system.width, components=system.components[True])
+    return unroll(system.horizon, sequenced, final, width=system.width)
+
+
+def assert_same_system(system):
+    full_sys, G, timesteps = fresh_unroll(system)
+    assert canonical_contract(system.full_sys) == canonical_contract(full_sys)
+    assert set(system.G.nodes) == set(G.nodes)
+    for node in G:
+        assert dict(system.G.nodes[node]) == dict(G.nodes[node]), node
+    assert set(system.G.edges) == set(G.edges)
+    index, expected = system.G.graph['term_index'], G.graph['term_index']
+    assert {key: sorted(nodes) for key, nodes in index.nodes.items()} == {key: sorted(nodes) for key, nodes in expected.nodes.items()}
+    assert [step.timestep for step in system.timesteps] == [step.timestep for step in timesteps]
+
+
+@pytest.mark.parametrize('horizon', [1, 2, 3])
+def test_replace_matches_fresh_unroll(horizon):
+    system = IncrementalSystem(horizon, WIDTH)
+    assert_same_system(system)
+    for component, factory, final in [('tracker', weaker_tracker, None), ('planner', weaker_planner, True),
+                                      ('planner', weaker_planner, False), ('tracker', COMPONENTS['tracker'], None),
+                                      ('planner', COMPONENTS['planner'], None)]:
+        system.replace(component, factory, final)
+        assert_same_system(system)
+
+
+def test_replace_reuses_unchanged_parts():
+    system = IncrementalSystem(3, WIDTH)
+    # perception and planner are composed once per template before the tracker is added
+    stats = system.replace('tracker', weaker_tracker)
+    assert stats['reused_compositions'] == 2
+    # only the final timestep changes: the first layer is reused
+    stats = system.replace('planner', weaker_planner, final=True)
+    assert stats['templates'] == 1 and stats['timesteps'] == 1 and stats['reused_layers'] == 1
+    # nothing changed
+    stats = system.update()
+    assert stats['templates'] == stats['timesteps'] == stats['layers'] == stats['added_nodes'] == 0
+
+
+def test_replace_unknown_component():
+    system = IncrementalSystem(1, WIDTH)
+    with pytest.raises(ValueError):
+        system.replace('controller', weaker_tracker)
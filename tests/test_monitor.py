@@ -0,0 +1,123 @@
+"""
+Online monitoring of a handwritten system over two timesteps: guarantees a_t1 <=> b_t2 and c, with the
+component-level inputs a_t1 (perception_1) and b_t2 (tracker_2) feeding the first one.
+"""
+import csv
+import json
+import random
+
+import networkx as nx
+import pytest
+from pacti.contracts import PropositionalIoContract
+from pacti.terms.propositions.propositions import PropositionalTerm, _expr_to_str
+
+from alice_helperfunctions import term_evaluators
+from alice_monitor import OnlineMonitor, monitor
+
+FULL_SYS = PropositionalIoContract.from_strings(input_vars=['a_t1', 'c'], output_vars=['b_t2'], assumptions=[],
+                                                guarantees=['a_t1 <=> b_t2', 'c'])
+SOURCES = ['s0', 's1']
+
+
+def key(text):
+    return _expr_to_str(PropositionalTerm(text).expression)
+
+
+def diagnostics_graph():
+    G = nx.DiGraph()
+    attrs = {'type': 'guarantee', 'input': 'False', 'output': 'False', 'system_level': 'False'}
+    equivalence, c = (term_evaluators.key(term) for term in FULL_SYS.g.terms)
+    # a system-level output node of an intermediate composition, not fed by the sources
+    G.add_node('x0', **{**attrs, 'term': equivalence, 'contract': 'system_1', 'output': 'True', 'system_level': 'True'})
+    G.add_node('s0', **{**attrs, 'term': 'a_t1', 'contract': 'perception_1', 'input': 'True'})
+    G.add_node('s1', **{**attrs, 'term': 'b_t2', 'contract': 'tracker_2', 'input': 'True'})
+    G.add_node('f0', **{**attrs, 'term': equivalence, 'contract': 'full_system', 'output': 'True', 'system_level': 'True'})
+    G.add_node('f1', **{**attrs, 'term': c, 'contract': 'full_system', 'output': 'True', 'system_level': 'True'})
+    G.add_edges_from([('s0', 'f0'), ('s1', 'f0')])
+    return G
+
+
+def drive(n, rng, skip=()):
+    # record of timestep t assigns a_t, b_t (unless t is in skip) and, at the first timestep, c
+    records = []
+    for t in range(1, n + 1):
+        record = {'timestep': t, f'a_t{t}': rng.randint(0, 1)}
+        if t not in skip:
+            record[f'b_t{t}'] = rng.randint(0, 1)
+        if t == 1:
+            record['c'] = 1
+        records.append(record)
+    return records
+
+
+def summary(violation):
+    return violation._replace(term=_expr_to_str(violation.term.expression))
+
+
+def expected_offsets(records, slide=True):
+    values = {name: value for record in records for name, value in record.items()}
+    offsets = range(len(records) - 1) if slide else [0]
+    return [k for k in offsets if f'b_t{k+2}' in values and values[f'a_t{k+1}'] != values[f'b_t{k+2}']]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sliding_window(seed):
+    records = drive(50, random.Random(seed))
+    violations = list(monitor(records, FULL_SYS, diagnostics_graph(), SOURCES, slide=True))
+    assert [v.offset for v in violations] == expected_offsets(records)
+    for v in violations:
+        k = v.offset
+        assert v.timestep == k + 2 and v.index == 0 and v.node == 'f0'
+        # the term and the suspects of the instance at offset k
+        assert _expr_to_str(v.term.expression) == key(f'a_t{k+1} <=> b_t{k+2}')
+        assert v.suspects == [('s0', f'a_t{k+1}', f'perception_{k+1}'), ('s1', f'b_t{k+2}', f'tracker_{k+2}')]
+
+
+def test_without_slide():
+    rng = random.Random(0)
+    records = drive(20, rng)
+    records[0]['a_t1'], records[1]['b_t2'] = 1, 0
+    violations = list(monitor(records, FULL_SYS, diagnostics_graph(), SOURCES))
+    assert [(v.offset, v.timestep) for v in violations] == [(0, 2)]
+    assert violations[0].suspects == [('s0', 'a_t1', 'perception_1'), ('s1', 'b_t2', 'tracker_2')]
+
+
+@pytest.mark.parametrize('slide', [True, False])
+def test_constant_memory(slide):
+    online = OnlineMonitor(FULL_SYS, diagnostics_graph(), SOURCES, slide=slide)
+    sizes = []
+    for record in drive(2000, random.Random(1)):
+        online.push(record)
+        sizes.append((len(online.values), len(online._waiting), len(online._instances)))
+    assert max(sizes[100:]) <= max(sizes[:100])
+    assert len(online.values) <= 3
+
+
+def test_eviction():
+    # b_t5 never arrives: the instance at offset 3 waits for it window timesteps, then expires
+    online = OnlineMonitor(FULL_SYS, diagnostics_graph(), SOURCES, slide=True)
+    records = drive(12, random.Random(2), skip={5})
+    violations = [v for record in records for v in online.push(record)]
+    assert [v.offset for v in violations] == expected_offsets(records)
+    assert online.expired == 1
+    assert 'b_t5' not in online._waiting and 3 not in online._instances
+    # c in all 12 instances, a <=> b in all but the expired one and the one still waiting for b_t13
+    assert online.evaluated == 12 + 10
+
+
+def test_read_records(tmp_path):
+    records = drive(30, random.Random(3), skip={7})
+    expected = [summary(v) for v in monitor(records, FULL_SYS, diagnostics_graph(), SOURCES, slide=True)]
+    assert expected
+
+    jsonl = tmp_path / 'drive.jsonl'
+    jsonl.write_text(''.join(json.dumps(record) + '\n' for record in records) + '\n')
+    names = list(dict.fromkeys(name for record in records for name in record))
+    with open(tmp_path / 'drive.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, names)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({name: ['false', 'TRUE'][value] if name != 'timestep' else value for name, value in record.items()})
+
+    for path in [jsonl, tmp_path / 'drive.csv', str(tmp_path / 'drive.csv')]:
+        assert [summary(v) for v in monitor(path, FULL_SYS, diagnostics_graph(), SOURCES, slide=True)] == expected
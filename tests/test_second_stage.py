@@ -0,0 +1,96 @@
+"""
+Second-stage checks of handwritten component guarantees: fetch order, undetermined checks and stopping early.
+"""
+import networkx as nx
+import pytest
+
+from alice_helperfunctions import term_evaluators
+from alice_second_stage import SecondStage, fetch_from
+
+# node: (term, contract); a is observed, the x variables are internal
+TERMS = {
+    'n0': ('a', 'perception_1'),
+    'n1': ('x1 & x2', 'planner_1'),
+    'n2': ('x3', 'tracker_1'),
+    'n3': ('x1 | x4', 'planner_2'),
+    'n4': ('a', 'perception_2'),
+    'n5': ('x6', 'tracker_2'),
+    'n6': ('a | x5', 'planner_1'),
+    'n7': ('a & x5', 'planner_2'),
+}
+VALUES = {'a': 0}
+INTERNAL = {'x1': [0], 'x2': [1], 'x3': [0], 'x4': [1], 'x6': [0]}
+
+
+def diagnostics_graph():
+    G = nx.DiGraph()
+    for node, (term, contract) in TERMS.items():
+        G.add_node(node, type='guarantee', term=term_evaluators.key(term), contract=contract, input='True', output='False', system_level='False')
+    return G
+
+
+def recording(trace):
+    # fetch callback that records the names of every request
+    requests = []
+    fetch = fetch_from(trace)
+
+    def record(names):
+        requests.append(list(names))
+        return fetch(names)
+    return record, requests
+
+
+def summary(results):
+    return [(result.nodes, result.status, result.fetched) for result in results]
+
+
+def test_cheapest_first():
+    fetch, requests = recording(INTERNAL)
+    stage = SecondStage(diagnostics_graph(), VALUES, fetch)
+    results = stage.run(['n3', 'n1', 'n2', 'n0', 'n4'])
+    # a needs no fetch, x3 one variable; x1 is fetched once, for the first of the two checks needing it
+    assert summary(results) == [(['n0', 'n4'], 'violated', []),
+                                (['n2'], 'violated', ['x3']),
+                                (['n3'], 'satisfied', ['x1', 'x4']),
+                                (['n1'], 'violated', ['x2'])]
+    assert requests == [['x3'], ['x1', 'x4'], ['x2']]
+    assert stage.fetched == ['x3', 'x1', 'x4', 'x2'] and stage.fetch_calls == 3
+    assert stage.explanation is None
+
+
+def test_unknown():
+    # x4 and x5 cannot be fetched
+    fetch, requests = recording({'x1': [0]})
+    stage = SecondStage(diagnostics_graph(), VALUES, fetch)
+    results = stage.run(['n3', 'n6', 'n7'])
+    # a & x5 is violated for any x5; x5 is requested once, the second check needing it knows it is unavailable
+    assert summary(results) == [(['n6'], 'unknown', []), (['n7'], 'violated', []), (['n3'], 'unknown', ['x1'])]
+    assert requests == [['x5'], ['x1', 'x4']]
+    assert stage.unavailable == {'x4', 'x5'}
+    # without a fetch callback nothing is fetched
+    stage = SecondStage(diagnostics_graph(), VALUES)
+    assert summary(stage.run(['n2', 'n7'])) == [(['n2'], 'unknown', []), (['n7'], 'violated', [])]
+    assert stage.fetch_calls == 0
+
+
+@pytest.mark.parametrize('stop_early', [False, True])
+def test_minimal_cover(stop_early):
+    # n1 explains both system-level guarantees, but n0 and n2 are cheaper and explain one each
+    explains = {'n0': {'g0'}, 'n1': {'g0', 'g1'}, 'n2': {'g1'}, 'n5': {'g0'}}
+    fetch, requests = recording(INTERNAL)
+    stage = SecondStage(diagnostics_graph(), VALUES, fetch)
+    results = stage.run(['n0', 'n5', 'n1', 'n2'], explains, stop_early=stop_early)
+    assert stage.explanation == ['n0', 'n2']
+    if stop_early:
+        # n5 can only explain g0, explained by n0, so it is skipped; n1 is not needed after n2
+        assert summary(results) == [(['n0'], 'violated', []), (['n2'], 'violated', ['x3'])]
+        assert requests == [['x3']]
+    else:
+        assert [result.nodes for result in results] == [['n0'], ['n5'], ['n2'], ['n1']]
+        assert all(result.status == 'violated' for result in results)
+        assert requests == [['x6'], ['x3'], ['x1', 'x2']]
+
+
+def test_stop_early_needs_explains():
+    with pytest.raises(ValueError, match='explains'):
+        SecondStage(diagnostics_graph(), VALUES).run(['n0'], stop_early=True)
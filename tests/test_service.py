@@ -0,0 +1,144 @@
+"""
+Diagnosis service over a Unix socket, with a handwritten artifact: guarantee a <=> b, reached by the
+component-level inputs a (perception_1) and x (planner_1).
+"""
+import asyncio
+import json
+
+import pytest
+
+import alice_service
+from alice_artifact import Artifact, write_artifact
+from alice_service import DiagnosisService, _TOO_LONG, _connect, _read_line, generate_load
+
+DATA = {
+    'horizon': 1,
+    'width': 0,
+    'contract': {'input_vars': ['a'], 'output_vars': ['b'], 'assumptions': [], 'guarantees': ['Equivalent(a, b)']},
+    'terms': {'Equivalent(a, b)': (('a', 'b'), 'bool(((not v0) == (not v1)))'), 'a': (('a',), 'bool(v0)'), 'x': (('x',), 'bool(v0)')},
+    'guarantee_nodes': ['g'],
+    'sources': [('s0', 'a', 'perception_1'), ('s1', 'x', 'planner_1')],
+    'reach': {'g': 0b11},
+    'nodes': [('s0', {'term': 'a', 'contract': 'perception_1'}), ('s1', {'term': 'x', 'contract': 'planner_1'}),
+              ('g', {'term': 'Equivalent(a, b)', 'contract': 'system_1'})],
+    'edges': [('s0', 'g'), ('s1', 'g')],
+    'term_nodes': {'a': ['s0'], 'x': ['s1'], 'Equivalent(a, b)': ['g']},
+}
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    path = str(tmp_path / 'toy.artifact')
+    write_artifact(path, DATA)
+    return path
+
+
+@pytest.fixture
+def socket(tmp_path):
+    return str(tmp_path / 'alice.sock')
+
+
+async def exchange(reader, writer, line):
+    writer.write((line if isinstance(line, str) else json.dumps(line)).encode() + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def diagnosis(values, internal=None):
+    # the diagnosis of the same values by the artifact, as the service sends it
+    return json.loads(json.dumps(Artifact(DATA).diagnose(values, internal)._asdict()))
+
+
+@pytest.mark.parametrize('processes', [0, 1])
+def test_diagnosis_of_parsed_values(artifact, socket, processes):
+    async def run():
+        async with DiagnosisService(artifact, processes=processes) as service:
+            await service.start(socket)
+            reader, writer = await _connect(socket)
+            # '0' is the value 0, not a truthy string
+            result = await exchange(reader, writer, {'id': 1, 'values': {'a': 1, 'b': '0'}})
+            assert result['id'] == 1 and result['diagnosis'] == diagnosis({'a': 1, 'b': 0})
+            assert [key for _, key, _ in result['diagnosis']['violated']] == ['Equivalent(a, b)']
+            result = await exchange(reader, writer, {'id': 2, 'values': {'a': 'True', 'b': 0}, 'internal': {'x': 'false'}})
+            assert result['diagnosis'] == diagnosis({'a': 1, 'b': 0}, {'x': 0})
+            assert [status for *_, status in result['diagnosis']['components']] == ['satisfied', 'violated']
+            result = await exchange(reader, writer, {'id': 3, 'values': {'a': 'true', 'b': 1}})
+            assert result['diagnosis']['violated'] == []
+            writer.close()
+    asyncio.run(run())
+
+
+def test_bad_requests(artifact, socket):
+    async def run():
+        async with DiagnosisService(artifact, processes=0) as service:
+            await service.start(socket)
+            reader, writer = await _connect(socket)
+            result = await exchange(reader, writer, {'id': 1, 'values': {'a': 'yes', 'b': 1}})
+            assert result['id'] == 1 and 'variable a' in result['error']
+            result = await exchange(reader, writer, {'id': 2, 'values': {'a': 1}, 'internal': [1]})
+            assert result['id'] == 2 and 'internal' in result['error']
+            result = await exchange(reader, writer, {'id': 3, 'values': [1, 0]})
+            assert result['id'] == 3 and 'values' in result['error']
+            assert 'error' in await exchange(reader, writer, 'not json')
+            metrics = (await exchange(reader, writer, {'op': 'metrics'}))['metrics']
+            assert metrics['submitted'] == metrics['completed'] == 0
+            writer.close()
+    asyncio.run(run())
+
+
+def test_overlong_line(artifact, socket, monkeypatch):
+    monkeypatch.setattr(alice_service, 'LINE_LIMIT', 256)
+
+    async def run():
+        async with DiagnosisService(artifact, processes=0) as service:
+            await service.start(socket)
+            reader, writer = await _connect(socket)
+            writer.write(b'{"id": 0, "values": {"a": "' + b'1' * 1000 + b'"}}\n')
+            result = await exchange(reader, writer, {'id': 1, 'values': {'a': 1, 'b': 1}})
+            assert 'line longer than 256 bytes' in result['error']
+            # the connection is still usable
+            assert json.loads(await reader.readline())['id'] == 1
+            writer.close()
+    asyncio.run(run())
+
+
+def test_read_line():
+    async def run():
+        reader = asyncio.StreamReader(limit=16)
+        reader.feed_data(b'short\n' + b'y' * 40 + b'\nend')
+        reader.feed_eof()
+        return [await _read_line(reader) for _ in range(4)]
+    assert asyncio.run(run()) == [b'short\n', _TOO_LONG, b'end', b'']
+
+
+def test_backpressure(artifact, socket):
+    async def run():
+        async with DiagnosisService(artifact, processes=0, queue_size=2) as service:
+            await service.start(socket)
+            stats = await generate_load({'a': 1, 'b': 1}, socket, requests=40, connections=4, window=8, flip=0.5)
+            assert stats['errors'] == 0
+            assert stats['service']['completed'] == 40
+            # the clients were kept waiting instead of growing the queue
+            assert 0 < stats['service']['max_queue_depth'] <= 2
+    asyncio.run(run())
+
+
+def test_close_with_open_client(artifact, socket):
+    async def run():
+        service = await DiagnosisService(artifact, processes=0).start(socket)
+        reader, writer = await _connect(socket)
+        assert 'diagnosis' in await exchange(reader, writer, {'id': 1, 'values': {'a': 1, 'b': 0}})
+        await service.close()
+        # the handler closed the connection and no task is left to be cancelled by asyncio.run
+        assert await asyncio.wait_for(reader.read(), 5) == b''
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+        writer.close()
+    asyncio.run(run())
+
+
+def test_start_failure(tmp_path, socket):
+    async def run():
+        async with DiagnosisService(str(tmp_path / 'missing.artifact'), processes=0) as service:
+            await service.start(socket)
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
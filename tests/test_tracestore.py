@@ -0,0 +1,68 @@
+"""
+Trace store round trips for every number of samples up to 200, and reads of ranges not aligned to bytes.
+"""
+import random
+
+import pytest
+
+from alice_tracestore import TraceStore, write_trace_store
+
+NAMES = ['poor_visibility', 'v_t1', 'z0_1', 'q_1_t2']
+
+
+def random_trace(rng, n):
+    return {name: [rng.randint(0, 1) for _ in range(n)] for name in NAMES}
+
+
+@pytest.fixture
+def store(tmp_path):
+    # write a trace of n samples and open it
+    def open_store(trace):
+        path = str(tmp_path / 'trace.trc')
+        write_trace_store(path, trace)
+        return TraceStore(path)
+    return open_store
+
+
+def test_round_trip(store):
+    rng = random.Random(0)
+    for n in range(201):
+        trace = random_trace(rng, n)
+        with store(trace) as ts:
+            assert len(ts) == n and ts.names == NAMES
+            assert ts.to_trace() == trace
+            for i in range(n):
+                assert ts.sample(i) == {name: values[i] for name, values in trace.items()}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_unaligned_ranges(store, seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 200)
+    trace = random_trace(rng, n)
+    with store(trace) as ts:
+        for _ in range(100):
+            start, stop = rng.randint(-n - 3, n + 3), rng.choice([None, rng.randint(-n - 3, n + 3)])
+            for name in NAMES:
+                assert ts.column(name, start, stop).tolist() == [bool(v) for v in trace[name][start:stop]], (start, stop)
+            assert ts.to_trace(start, stop) == {name: values[start:stop] for name, values in trace.items()}
+        names = rng.sample(NAMES, 2)
+        i = rng.randrange(n)
+        assert ts.sample(i, names) == {name: trace[name][i] for name in names}
+        assert list(ts.columns(names=names)) == names
+
+
+def test_errors(store, tmp_path):
+    with store({'a': [1, 0, 1]}) as ts:
+        with pytest.raises(IndexError):
+            ts.sample(3)
+        with pytest.raises(IndexError):
+            ts.sample(-1)
+        assert 'a' in ts and 'b' not in ts
+    with store({}) as ts:
+        assert len(ts) == 0 and ts.names == [] and ts.to_trace() == {}
+    with pytest.raises(ValueError, match='different lengths'):
+        write_trace_store(str(tmp_path / 'bad.trc'), {'a': [1, 0], 'b': [1]})
+    (tmp_path / 'other.trc').write_bytes(b'not a trace store' * 10)
+    with pytest.raises(ValueError, match='not a trace store'):
+        TraceStore(str(tmp_path / 'other.trc'))
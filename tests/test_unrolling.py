@@ -0,0 +1,65 @@
+"""
+Timestep templates against composing at the timestep, and unrolling in a process pool against the serial unroll.
+"""
+import pytest
+
+from alice_cache import canonical_contract
+from alice_helperfunctions import ReachabilityIndex, system_guarantee_nodes, term_index
+from alice_unrolling import TimestepTemplate, unroll
+
+WIDTH = 2
+
+
+def component_sources(G, horizon):
+    contracts = {f'{component}_{k}' for k in range(1, horizon+1) for component in ['perception', 'planner', 'tracker']}
+    return [node for node, attrs in G.nodes(data=True) if attrs['input'] == 'True' and attrs['contract'] in contracts]
+
+
+def reached_inputs(G, horizon):
+    # (term, contract) of the component-level inputs reaching every full_system guarantee
+    sources = component_sources(G, horizon)
+    reachability = ReachabilityIndex(G, sources)
+    return {term: sorted((G.nodes[src]['term'], G.nodes[src]['contract']) for node in nodes for src in reachability.sources_of(node))
+            for term, nodes in system_guarantee_nodes(G).items()}
+
+
+@pytest.mark.parametrize('final', [False, True])
+def test_instantiate_matches_composing(final):
+    step = TimestepTemplate(1, final, width=WIDTH).instantiate(3)
+    composed = TimestepTemplate(3, final, width=WIDTH)
+    assert step.timestep == 3
+    assert canonical_contract(step.sys) == canonical_contract(composed.sys)
+    # the nodes of the instance are those of the template with a _t3 suffix
+    assert set(step.G.nodes) == {f'{node}_t3' for node in composed.G}
+    for node, attrs in composed.G.nodes(data=True):
+        assert dict(step.G.nodes[f'{node}_t3']) == dict(attrs), node
+    assert set(step.G.edges) == {(f'{u}_t3', f'{v}_t3') for u, v in composed.G.edges}
+    expected = term_index(composed.G)
+    assert {key: sorted(nodes) for key, nodes in step.G.graph['term_index'].nodes.items()} == \
+        {key: sorted(f'{node}_t3' for node in nodes) for key, nodes in expected.nodes.items()}
+
+@pytest.fixture(scope='module')
+def serial():
+    return {horizon: unroll(horizon, width=WIDTH) for horizon in range(2, 6)}
+
+
+@pytest.mark.parametrize('horizon', range(2, 6))
+def test_parallel_matches_serial(serial, horizon):
+    full_sys, G, timesteps = serial[horizon]
+    parallel_sys, H, parallel_timesteps = unroll(horizon, width=WIDTH, processes=2)
+    assert canonical_contract(parallel_sys) == canonical_contract(full_sys)
+    assert set(H.nodes) == set(G.nodes)
+    for node in G:
+        assert dict(H.nodes[node]) == dict(G.nodes[node]), node
+    assert set(H.edges) == set(G.edges)
+    assert [step.timestep for step in parallel_timesteps] == [step.timestep for step in timesteps]
+
+
+@pytest.mark.parametrize('horizon', range(2, 6))
+def test_tree_matches_serial_reachability(serial, horizon):
+    full_sys, G, _ = serial[horizon]
+    tree_sys, H, _ = unroll(horizon, width=WIDTH, processes=2, tree=True)
+    assert canonical_contract(tree_sys)['guarantees'] == canonical_contract(full_sys)['guarantees']
+    assert sorted((H.nodes[node]['term'], H.nodes[node]['contract']) for node in component_sources(H, horizon)) == \
+        sorted((G.nodes[node]['term'], G.nodes[node]['contract']) for node in component_sources(G, horizon))
+    assert reached_inputs(H, horizon) == reached_inputs(G, horizon)